@@ -1,103 +1,551 @@
 from pygame.locals import *
 import pygame
 import sys
+import struct
+import hashlib
+import argparse
 import random as rnd
-from math import sqrt
+from math import sqrt, ceil, floor, log2
+import numpy as np
 
 FPS = 30
-
-screen = pygame.display.set_mode((0,0), pygame.FULLSCREEN)
-WIDTH = screen.get_width()
-HEIGHT = screen.get_height()
+# the simulation always advances in steps of this many seconds
+TICK = 1/FPS
+# side of the buckets of the food grid; about the size of a new Cell
+FOOD_BUCKET = 16
+FOOD_RADIUS = 3
+BACKGROUND = (0,0,0)
+# side of the square tiles the food layer is split into
+FOOD_TILE = 256
+# the world is this many screens wide and this many screens high
+WORLD_SCALE = 4
+# a Cell of radius r wants to see this many radii around itself
+CAMERA_MARGIN = 12
+# up, down, left and right of each player
+PLAYER_KEYS = [(K_w, K_s, K_a, K_d), (K_i, K_k, K_j, K_l)]
+# x, y, vx, vy, speed and radius of a Cell, as digest() hashes them
+DIGEST_CELL = struct.Struct("!5dq")
 
 class BattleField(object):
-    def __init__(self, surf):
-        self.surf = surf
-        self.w = self.surf.get_width()
-        self.h = self.surf.get_height()
+    """The simulation of the arena, independent of any display.
+    step() advances it by a fixed dt and draw() renders it; a headless
+    BattleField never creates a Surface so it can run without a window.
+    All randomness comes from self.rng, seeded with seed.
+    With kernel=True the cells eat and move in the batched NumpyKernel
+    instead of one by one; both give exactly the same results."""
+    def __init__(self, size, seed=None, headless=False, kernel=False):
+        self.w, self.h = size
+        self.rng = rnd.Random(seed)
+
+        self.cells = []
+        self.controllers = []
+
+        self.food_target = 100
+        # pellets spawned per step while below food_target
+        self.food_rate = 2
+        self.foods = FoodStore(FOOD_BUCKET)
+        self.food_layer = None if headless else FoodLayer((self.w, self.h))
+        self.kernel = NumpyKernel() if kernel else None
+        # what happened to the food during the last step, for whoever
+        # has to mirror it: (x, y, rgb) spawned and (x, y) eaten
+        self.spawned = []
+        self.eaten = []
 
-        self.p1 = Cell(self.surf, (WIDTH//3, HEIGHT//2), (255,0,0))
-        self.p2 = Cell(self.surf, (2*WIDTH//3, HEIGHT//2), (0,0,255))
+    def add_cell(self, cell, controller):
+        self.cells.append(cell)
+        self.controllers.append(controller)
 
-        self.foods = []
+    def spawn_ai(self, n):
+        for i in range(n):
+            pos = (self.rng.randint(0, self.w), self.rng.randint(0, self.h))
+            cell = Cell(pos, get_random_colour(self.rng))
+            self.add_cell(cell, AIController(self.rng))
 
     def generate_food(self):
-        c = get_random_colour()
-        x = rnd.randint(0, WIDTH)
-        y = rnd.randint(0, HEIGHT)
-        self.foods.append((x,y,c))
-
-    def movep1(self, ev):
-        btn_down = {K_w: (0,-1),
-                    K_s: (0, 1),
-                    K_a: (-1,0),
-                    K_d: ( 1,0)}
+        c = get_random_colour(self.rng)
+        x = self.rng.randint(0, self.w)
+        y = self.rng.randint(0, self.h)
+        self.foods.add(x, y, pack_colour(c))
+        self.spawned.append((x, y, pack_colour(c)))
+        if self.food_layer:
+            self.food_layer.stamp(x, y, c)
+
+    def handle_event(self, ev):
+        for cell, controller in zip(self.cells, self.controllers):
+            controller.handle_event(cell, ev)
+
+    def touching_pairs(self):
+        """Sweep and prune over the x axis.
+        Returns the sorted (i, j) index pairs, i < j, of the live cells
+        whose [x - 1.2*radius, x + 1.2*radius] intervals overlap, which
+        are the only pairs where one cell can be eating the other"""
+        intervals = []
+        for i, cell in enumerate(self.cells):
+            if cell.radius:
+                reach = 1.2*cell.radius
+                intervals.append((cell.x - reach, cell.x + reach, i))
+        intervals.sort()
+        pairs = []
+        active = []
+        for lo, hi, i in intervals:
+            active = [(a_hi, a) for a_hi, a in active if a_hi >= lo]
+            for a_hi, a in active:
+                pairs.append((a, i) if a < i else (i, a))
+            active.append((hi, i))
+        pairs.sort()
+        return pairs
+
+    def eat_cells(self):
+        for i, j in self.touching_pairs():
+            a, b = self.cells[i], self.cells[j]
+            # either may have been eaten by an earlier pair
+            if a.radius == 0 or b.radius == 0:
+                continue
+            if a.radius > 1.2*b.radius:
+                big, small = a, b
+            elif b.radius > 1.2*a.radius:
+                big, small = b, a
+            else:
+                continue
+            d = dist((a.x,a.y), (b.x,b.y))
+            if d < 1.2*(big.radius - small.radius):
+                big.radius += small.radius
+                small.radius = 0
+
+    def spawn_food(self):
+        for i in range(self.food_rate):
+            if len(self.foods) < self.food_target:
+                self.generate_food()
+
+    def steer(self):
+        for cell, controller in zip(self.cells, self.controllers):
+            if cell.radius:
+                controller.steer(cell, self)
+
+    def eat_food(self):
+        claimed = set()
+        for cell in self.cells:
+            if cell.radius == 0:
+                continue
+            for i in self.foods.inside(cell.x, cell.y, cell.radius).tolist():
+                # a pellet inside two cells goes to the first one
+                if i not in claimed:
+                    claimed.add(i)
+                    cell.eat()
+        self.remove_food(claimed)
+
+    def remove_food(self, slots):
+        eaten = self.foods.remove_many(slots)
+        self.eaten.extend(eaten)
+        if self.food_layer:
+            for x,y in eaten:
+                self.food_layer.erase(x, y, self.foods)
+
+    def move(self, dt=TICK):
+        for cell in self.cells:
+            cell.update(dt)
+            # the world has walls
+            cell.x = min(max(cell.x, 0), self.w)
+            cell.y = min(max(cell.y, 0), self.h)
+
+    def step(self, dt=TICK):
+        self.spawned = []
+        self.eaten = []
+        self.spawn_food()
+        self.steer()
+        if self.kernel:
+            self.kernel.step(self, dt)
+        else:
+            self.eat_food()
+            self.eat_cells()
+            self.move(dt)
+
+    def draw(self, surf, camera=None):
+        if camera is None:
+            camera = Camera(surf.get_size(), (self.w, self.h))
+        surf.fill(BACKGROUND)
+        self.food_layer.draw(surf, camera)
+        visible = [cell for cell in self.cells
+                    if cell.radius and camera.sees(cell.x, cell.y, cell.radius)]
+        # bigger cells are drawn first so smaller ones stay visible
+        for cell in sorted(visible, key=lambda c: -c.radius):
+            cell.draw(surf, camera)
+
+    def update_and_draw(self, surf):
+        self.step()
+        self.draw(surf)
+
+class NumpyKernel(object):
+    """Batched version of the eat_food, eat_cells and move stages.
+    The position, velocity, speed and radius of every cell are copied
+    into arrays, the three stages run as array operations over all the
+    cells at once, and the results are copied back into the Cells.
+    Every step gives exactly the same state as the per-cell code."""
+    def step(self, field, dt):
+        cells = field.cells
+        x = np.array([c.x for c in cells], dtype=np.float64)
+        y = np.array([c.y for c in cells], dtype=np.float64)
+        vx = np.array([c.vx for c in cells], dtype=np.float64)
+        vy = np.array([c.vy for c in cells], dtype=np.float64)
+        speed = np.array([c.speed for c in cells], dtype=np.float64)
+        min_speed = np.array([c.minSpeed for c in cells], dtype=np.float64)
+        radius = np.array([c.radius for c in cells], dtype=np.int64)
+
+        self.eat_food(field, x, y, radius, speed, min_speed)
+        self.eat_cells(x, y, radius)
+        moving = self.move(field, dt, x, y, vx, vy, speed, radius)
+
+        for i, cell in enumerate(cells):
+            cell.radius = int(radius[i])
+            cell.speed = float(speed[i])
+            if moving[i]:
+                cell.vx, cell.vy = float(vx[i]), float(vy[i])
+            cell.x, cell.y = float(x[i]), float(y[i])
+
+    def eat_food(self, field, x, y, radius, speed, min_speed):
+        foods = field.foods
+        owners, slots = [], []
+        for i in np.flatnonzero(radius).tolist():
+            found = foods.candidates(x[i], y[i], radius[i])
+            owners.append(np.full(len(found), i))
+            slots.append(found)
+        if not slots:
+            return
+        owners = np.concatenate(owners)
+        slots = np.concatenate(slots)
+        dx = foods.x[slots] - x[owners]
+        dy = foods.y[slots] - y[owners]
+        r = radius[owners]
+        hit = dx*dx + dy*dy <= r*r
+        owners, slots = owners[hit], slots[hit]
+        # a pellet inside two cells goes to the first one
+        order = np.lexsort((owners, slots))
+        slots, first = np.unique(slots[order], return_index=True)
+        eats = np.bincount(owners[order][first], minlength=len(radius))
+
+        radius += eats
+        # Cell.eat lowers the speed one pellet at a time and the float
+        # subtractions have to happen in the same order
+        while eats.any():
+            slow_down = (eats > 0) & (speed > min_speed)
+            speed[slow_down] -= 0.04
+            eats[eats > 0] -= 1
+        field.remove_food(slots.tolist())
+
+    def eat_cells(self, x, y, radius):
+        alive = np.flatnonzero(radius)
+        reach = 1.2*radius[alive]
+        lo = x[alive] - reach
+        hi = x[alive] + reach
+        # sweep and prune: sorted by lo, an interval overlaps the ones
+        # after it up to the last that starts before it ends
+        order = np.argsort(lo, kind="stable")
+        lo, hi = lo[order], hi[order]
+        end = np.searchsorted(lo, hi, side="right")
+        counts = end - np.arange(1, len(lo) + 1)
+        total = counts.sum()
+        if not total:
+            return
+        first = np.repeat(np.arange(len(lo)), counts)
+        # each run of pairs starts at the interval after its first one
+        starts = np.cumsum(counts) - counts
+        second = np.arange(total) - np.repeat(starts - 1, counts) + first
+        a, b = alive[order[first]], alive[order[second]]
+        ii, jj = np.minimum(a, b), np.maximum(a, b)
+        # the pairs BattleField.touching_pairs finds, in the same order
+        pairs = np.lexsort((jj, ii))
+        xs, ys, rs = x.tolist(), y.tolist(), radius.tolist()
+        for i, j in zip(ii[pairs].tolist(), jj[pairs].tolist()):
+            if rs[i] == 0 or rs[j] == 0:
+                continue
+            if rs[i] > 1.2*rs[j]:
+                big, small = i, j
+            elif rs[j] > 1.2*rs[i]:
+                big, small = j, i
+            else:
+                continue
+            d = dist((xs[i],ys[i]), (xs[j],ys[j]))
+            if d < 1.2*(rs[big] - rs[small]):
+                rs[big] += rs[small]
+                rs[small] = 0
+        radius[:] = rs
+
+    def move(self, field, dt, x, y, vx, vy, speed, radius):
+        """Returns the mask of the cells whose velocity was normalised"""
+        sp = np.sqrt(vx*vx + vy*vy)
+        moving = (radius != 0) & (sp != 0)
+        excess = sp[moving]/speed[moving]
+        vx[moving] /= excess
+        vy[moving] /= excess
+        x[moving] += vx[moving]*dt*FPS
+        y[moving] += vy[moving]*dt*FPS
+        # the world has walls
+        np.clip(x, 0, field.w, out=x)
+        np.clip(y, 0, field.h, out=y)
+        return moving
+
+class Controller(object):
+    """Drives a Cell by setting its velocity.
+    handle_event gets every KEYDOWN/KEYUP event and steer is called
+    once per frame, before the cells eat and move"""
+    def handle_event(self, cell, ev):
+        pass
+
+    def steer(self, cell, field):
+        pass
+
+class KeyboardController(Controller):
+    def __init__(self, up, down, left, right):
+        self.btn_down = {up: (0,-1),
+                         down: (0, 1),
+                         left: (-1,0),
+                         right: ( 1,0)}
+
+    def handle_event(self, cell, ev):
+        if ev.key not in self.btn_down:
+            return
+        dx, dy = self.btn_down[ev.key]
         if ev.type == KEYDOWN:
-            dx, dy = btn_down[ev.key]
             if dx:
-                self.p1.vx = dx*self.p1.speed
+                cell.vx = dx*cell.speed
             if dy:
-                self.p1.vy = dy*self.p1.speed
+                cell.vy = dy*cell.speed
         elif ev.type == KEYUP:
-            if ev.key in [K_w, K_s]:
-                self.p1.vy = 0
-            elif ev.key in [K_a, K_d]:
-                self.p1.vx = 0
-
-    def movep2(self, ev):
-        btn_down = {K_i: (0,-1),
-                    K_k: (0, 1),
-                    K_j: (-1,0),
-                    K_l: ( 1,0)}
-        if ev.type == KEYDOWN:
-            dx, dy = btn_down[ev.key]
-            if dx:
-                self.p2.vx = dx*self.p2.speed
             if dy:
-                self.p2.vy = dy*self.p2.speed
-        elif ev.type == KEYUP:
-            if ev.key in [K_i, K_k]:
-                self.p2.vy = 0
-            elif ev.key in [K_j, K_l]:
-                self.p2.vx = 0
-
-    def update_and_draw(self):
-        if len(self.foods) < 100:
-            self.generate_food()
-
-        self.surf.fill((0,0,0))
-        i = 0
-        while i < len(self.foods):
-            x,y,c = self.foods[i]
-            if dist((x,y), (self.p1.x,self.p1.y)) <= self.p1.radius:
-                self.p1.eat()
-                self.foods.pop(i)
-            elif dist((x,y), (self.p2.x,self.p2.y)) <= self.p2.radius:
-                self.p2.eat()
-                self.foods.pop(i)
-            else:
-                pygame.draw.circle(self.surf, c, (x,y), 3)
-                i += 1
-        d = dist((self.p1.x,self.p1.y), (self.p2.x,self.p2.y))
-        if self.p1.radius > 1.2*self.p2.radius:
-            # p1 can eat p2, is it close enough?
-            if d < 1.2*(self.p1.radius - self.p2.radius):
-                self.p1.radius += self.p2.radius
-                self.p2.radius = 0
-        elif self.p2.radius > 1.2*self.p1.radius:
-            if d < 1.2*(self.p2.radius - self.p1.radius):
-                self.p2.radius += self.p1.radius
-                self.p1.radius = 0
-        if self.p1.radius > self.p2.radius:
-            self.p1.update_and_draw()
-            self.p2.update_and_draw()
+                cell.vy = 0
+            elif dx:
+                cell.vx = 0
+
+class AIController(Controller):
+    """Scripted AI that heads for the nearest pellet in sight
+    and wanders around when there is none.
+    It only looks around every few frames to keep big crowds cheap"""
+    def __init__(self, rng, sight=80, think_every=10):
+        self.rng = rng
+        self.sight = sight
+        self.think_every = think_every
+        # spread the thinking of many AIs over different frames
+        self.countdown = rng.randint(0, think_every)
+
+    def steer(self, cell, field):
+        self.countdown -= 1
+        if self.countdown > 0:
+            return
+        self.countdown = self.think_every
+
+        foods = field.foods
+        slots = foods.inside(cell.x, cell.y, self.sight)
+        if len(slots):
+            dx = foods.x[slots] - cell.x
+            dy = foods.y[slots] - cell.y
+            k = int(np.argmin(dx*dx + dy*dy))
+            cell.vx, cell.vy = float(dx[k]), float(dy[k])
+        elif cell.vx == cell.vy == 0 or self.rng.random() < 0.1:
+            cell.vx = self.rng.uniform(-1, 1)
+            cell.vy = self.rng.uniform(-1, 1)
+        # keep away from the walls
+        if not 0 < cell.x < field.w:
+            cell.vx = field.w/2 - cell.x
+        if not 0 < cell.y < field.h:
+            cell.vy = field.h/2 - cell.y
+
+class ReplayController(Controller):
+    """Replays a sequence of per-frame (vx, vy) velocities"""
+    def __init__(self, moves):
+        self.moves = iter(moves)
+
+    def steer(self, cell, field):
+        cell.vx, cell.vy = next(self.moves, (0, 0))
+
+class FoodStore(object):
+    """Struct-of-arrays storage for the food pellets.
+    Positions and packed RGB colours live in NumPy arrays, deletion
+    is a swap-remove with the last pellet and a uniform grid of slot
+    indices narrows "which pellets are inside this circle" queries
+    down to the buckets the circle overlaps."""
+    def __init__(self, bucket_size, capacity=1024):
+        self.bucket_size = bucket_size
+        self.x = np.empty(capacity, dtype=np.int32)
+        self.y = np.empty(capacity, dtype=np.int32)
+        self.rgb = np.empty(capacity, dtype=np.uint32)
+        self.count = 0
+        self.buckets = {}
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        n = self.count
+        xs, ys = self.x[:n].tolist(), self.y[:n].tolist()
+        for x, y, c in zip(xs, ys, self.rgb[:n].tolist()):
+            yield (x, y, unpack_colour(c))
+
+    def key(self, x, y):
+        return (int(x // self.bucket_size), int(y // self.bucket_size))
+
+    def add(self, x, y, rgb):
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i], self.y[i], self.rgb[i] = x, y, rgb
+        self.buckets.setdefault(self.key(x, y), []).append(i)
+        self.count += 1
+
+    def grow(self):
+        capacity = 2*len(self.x)
+        for name in ["x", "y", "rgb"]:
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def remove(self, i):
+        """Removes the pellet in slot i by moving the last one into it"""
+        last = self.count - 1
+        self.buckets[self.key(self.x[i], self.y[i])].remove(i)
+        if i != last:
+            bucket = self.buckets[self.key(self.x[last], self.y[last])]
+            bucket[bucket.index(last)] = i
+            self.x[i] = self.x[last]
+            self.y[i] = self.y[last]
+            self.rgb[i] = self.rgb[last]
+        self.count -= 1
+
+    def candidates(self, x, y, r):
+        """Returns the slots of the pellets in the buckets overlapped
+        by the circle of radius r around (x, y)"""
+        bx0, by0 = self.key(x-r, y-r)
+        bx1, by1 = self.key(x+r, y+r)
+        slots = []
+        if (bx1-bx0+1)*(by1-by0+1) > len(self.buckets):
+            # huge circle: cheaper to go over the non-empty buckets
+            for (bx, by), bucket in self.buckets.items():
+                if bx0 <= bx <= bx1 and by0 <= by <= by1:
+                    slots.extend(bucket)
         else:
-            self.p2.update_and_draw()
-            self.p1.update_and_draw()
+            for bx in range(bx0, bx1+1):
+                for by in range(by0, by1+1):
+                    slots.extend(self.buckets.get((bx, by), ()))
+        return np.array(slots, dtype=np.intp)
+
+    def inside(self, x, y, r):
+        """Returns the slots of the pellets within distance r of (x, y)"""
+        slots = self.candidates(x, y, r)
+        dx = self.x[slots] - x
+        dy = self.y[slots] - y
+        return slots[dx*dx + dy*dy <= r*r]
+
+    def remove_many(self, slots):
+        """Removes the pellets in the given slots
+        Returns the list of their (x, y) positions"""
+        slots = sorted(slots, reverse=True)
+        eaten = [(int(self.x[i]), int(self.y[i])) for i in slots]
+        # going from the highest slot down, the pellet swapped into a
+        # freed slot is never one we still have to remove
+        for i in slots:
+            self.remove(i)
+        return eaten
+
+class FoodLayer(object):
+    """Persistent surfaces with all the food pellets already drawn.
+    Pellets never move, so the layer is only touched when one spawns
+    or gets eaten. The world is cut in FOOD_TILE x FOOD_TILE tiles,
+    created when the first pellet lands on them; a frame blits only
+    the tiles the Camera sees, using copies scaled to its zoom that
+    are kept until the tile changes or the zoom does."""
+    def __init__(self, size):
+        self.w, self.h = size
+        self.tiles = {}
+        self.scaled = {}
+
+    def tiles_around(self, x, y, r):
+        for tx in range(floor((x-r)/FOOD_TILE), floor((x+r)/FOOD_TILE)+1):
+            for ty in range(floor((y-r)/FOOD_TILE), floor((y+r)/FOOD_TILE)+1):
+                yield (tx, ty)
+
+    def paint(self, x, y, c):
+        for key in self.tiles_around(x, y, FOOD_RADIUS):
+            tile = self.tiles.get(key)
+            if tile is None:
+                tile = self.tiles[key] = pygame.Surface((FOOD_TILE, FOOD_TILE))
+                tile.fill(BACKGROUND)
+            pos = (x - key[0]*FOOD_TILE, y - key[1]*FOOD_TILE)
+            pygame.draw.circle(tile, c, pos, FOOD_RADIUS)
+            self.scaled.pop(key, None)
+
+    def stamp(self, x, y, c):
+        self.paint(x, y, c)
+
+    def erase(self, x, y, foods):
+        self.paint(x, y, BACKGROUND)
+        # pellets overlapping the erased one lost some of their pixels
+        for i in foods.inside(x, y, 2*FOOD_RADIUS+1).tolist():
+            self.stamp(int(foods.x[i]), int(foods.y[i]),
+                        unpack_colour(int(foods.rgb[i])))
+
+    def draw(self, surf, camera):
+        zoom = camera.zoom
+        left, top, right, bottom = camera.view()
+        size = ceil(FOOD_TILE*zoom)
+        for tx in range(floor(left/FOOD_TILE), floor(right/FOOD_TILE)+1):
+            for ty in range(floor(top/FOOD_TILE), floor(bottom/FOOD_TILE)+1):
+                tile = self.tiles.get((tx, ty))
+                if tile is None:
+                    continue
+                if zoom != 1:
+                    cached = self.scaled.get((tx, ty))
+                    if cached is None or cached[0] != zoom:
+                        scaled = pygame.transform.smoothscale(tile, (size, size))
+                        cached = self.scaled[(tx, ty)] = (zoom, scaled)
+                    tile = cached[1]
+                surf.blit(tile, camera.to_screen(tx*FOOD_TILE, ty*FOOD_TILE))
+
+class Camera(object):
+    """Maps world coordinates to the screen.
+    follow() centres it on some cells and zooms out as they grow or
+    get far apart; the zoom is snapped to quarter powers of two so the
+    scaled food tiles can be reused from one frame to the next."""
+    def __init__(self, screen_size, world_size):
+        self.sw, self.sh = screen_size
+        self.ww, self.wh = world_size
+        self.cx, self.cy = self.sw/2, self.sh/2
+        self.target_zoom = 1
+        self.zoom = 1
+        # never zoom out past the point where the whole world fits
+        self.min_zoom = min(1, self.sw/self.ww, self.sh/self.wh)
+
+    def follow(self, cells):
+        alive = [c for c in cells if c.radius]
+        if not alive:
+            return
+        left = min(c.x - c.radius for c in alive)
+        right = max(c.x + c.radius for c in alive)
+        top = min(c.y - c.radius for c in alive)
+        bottom = max(c.y + c.radius for c in alive)
+        margin = 2*CAMERA_MARGIN*max(c.radius for c in alive)
+        zoom = min(1, self.sw/(right-left+margin), self.sh/(bottom-top+margin))
+        # ease towards the new view instead of jumping to it
+        self.cx += ((left+right)/2 - self.cx)/10
+        self.cy += ((top+bottom)/2 - self.cy)/10
+        self.target_zoom += (max(zoom, self.min_zoom) - self.target_zoom)/10
+        self.zoom = 2**(round(4*log2(self.target_zoom))/4)
+
+    def view(self):
+        """Returns the (left, top, right, bottom) world rect on screen"""
+        half_w = self.sw/(2*self.zoom)
+        half_h = self.sh/(2*self.zoom)
+        return (self.cx-half_w, self.cy-half_h, self.cx+half_w, self.cy+half_h)
+
+    def sees(self, x, y, r):
+        left, top, right, bottom = self.view()
+        return left-r <= x <= right+r and top-r <= y <= bottom+r
+
+    def to_screen(self, x, y):
+        left, top, right, bottom = self.view()
+        return (round((x-left)*self.zoom), round((y-top)*self.zoom))
 
 class Cell(object):
-    def __init__(self, surf, pos, c):
-        self.surf = surf
+    def __init__(self, pos, c):
         self.x, self.y = pos
         self.c = c
         
@@ -114,21 +562,42 @@ class Cell(object):
         if self.speed > self.minSpeed:
             self.speed -= 0.04
 
-    def update_and_draw(self):
+    def update(self, dt=TICK):
         if self.radius == 0:
             return
-        sp = dist((0,0), (self.vx,self.vy))
+        # products instead of dist's powers: this is correctly rounded
+        # everywhere and matches NumpyKernel.move bit for bit
+        sp = sqrt(self.vx*self.vx + self.vy*self.vy)
         if sp != 0:
             excess = sp/self.speed
             self.vx /= excess
             self.vy /= excess
-            self.x += self.vx
-            self.y += self.vy
+            # speeds are in pixels per frame at FPS frames per second
+            self.x += self.vx*dt*FPS
+            self.y += self.vy*dt*FPS
 
-        pygame.draw.circle(self.surf, self.c, (round(self.x),round(self.y)), self.radius)
+    def draw(self, surf, camera=None):
+        if self.radius == 0:
+            return
+        if camera is None:
+            pos, radius = (round(self.x),round(self.y)), self.radius
+        else:
+            pos = camera.to_screen(self.x, self.y)
+            radius = max(1, round(self.radius*camera.zoom))
+        pygame.draw.circle(surf, self.c, pos, radius)
+
+    def update_and_draw(self, surf, dt=TICK):
+        self.update(dt)
+        self.draw(surf)
+
+def get_random_colour(rng=rnd):
+    return [rng.randint(0, 255) for i in range(3)]
 
-def get_random_colour():
-    return [rnd.randint(0, 255) for i in range(3)]
+def pack_colour(c):
+    return (c[0] << 16) | (c[1] << 8) | c[2]
+
+def unpack_colour(rgb):
+    return ((rgb >> 16) & 255, (rgb >> 8) & 255, rgb & 255)
 
 def sgn(n):
     if n == 0:
@@ -141,29 +610,170 @@ def sgn(n):
 def dist(a, b):
     return sqrt((a[0]-b[0])**2 + (a[1]-b[1])**2)
     
-BF = BattleField(screen)
-clock = pygame.time.Clock()
-while True:
-    clock.tick(FPS)
-    for ev in pygame.event.get():
-        if ev.type == QUIT:
-            pygame.quit()
-            sys.exit()
-        elif ev.type == KEYDOWN:
-            if ev.key == K_ESCAPE:
-                pygame.quit()
-                sys.exit()
-            elif ev.key in [K_w, K_s, K_a, K_d]:
-                BF.movep1(ev)
-            elif ev.key in [K_j, K_k, K_l, K_i]:
-                BF.movep2(ev)
-        elif ev.type == KEYUP:
-            if ev.key in [K_w, K_s, K_a, K_d]:
-                BF.movep1(ev)
-            elif ev.key in [K_j, K_k, K_l, K_i]:
-                BF.movep2(ev)
-
-    if len(BF.foods) < 100:
-        BF.generate_food()
-    BF.update_and_draw()
-    pygame.display.update()
\ No newline at end of file
+def simulate(steps, n_ai=0, size=(1280, 720), seed=None, dt=TICK,
+                kernel=False):
+    """Runs a headless match of n_ai AI cells as fast as possible
+    Returns the BattleField after the given number of fixed steps"""
+    field = BattleField(size, seed=seed, headless=True, kernel=kernel)
+    field.spawn_ai(n_ai)
+    field.food_target = max(field.food_target, 10*n_ai)
+    for i in range(steps):
+        field.step(dt)
+    return field
+
+def new_game(size, seed, n_ai=0, spread=200, headless=False):
+    """Sets up a match: the two keyboard players, spread pixels left
+    and right of the centre of the world, and n_ai AI cells.
+    Returns the BattleField and the list of players"""
+    w, h = size
+    field = BattleField(size, seed=seed, headless=headless)
+    field.food_target = 100*WORLD_SCALE**2
+    players = [Cell((w//2 - spread, h//2), (255,0,0)),
+               Cell((w//2 + spread, h//2), (0,0,255))]
+    for player, keys in zip(players, PLAYER_KEYS):
+        field.add_cell(player, KeyboardController(*keys))
+    if n_ai:
+        field.spawn_ai(n_ai)
+        field.food_target = max(field.food_target, 10*len(field.cells))
+    return field, players
+
+def digest(field):
+    """Fingerprint of the state of a match, to check replays against"""
+    h = hashlib.sha1()
+    for cell in field.cells:
+        # a fixed binary form, so 1 and 1.0 hash the same
+        h.update(DIGEST_CELL.pack(float(cell.x), float(cell.y),
+                                    float(cell.vx), float(cell.vy),
+                                    float(cell.speed), cell.radius))
+    n = field.foods.count
+    for column in (field.foods.x, field.foods.y, field.foods.rgb):
+        h.update(column[:n].tobytes())
+    return h.digest()
+
+class Recorder(object):
+    """Writes a match to a compact binary log.
+    The header holds everything new_game needs to set the match up
+    again, then every KEYDOWN/KEYUP of the players is stored with the
+    number of the step it preceded and an END record closes the log
+    with the total number of steps and the digest of the final state.
+    Since the simulation only depends on the seed and on these events,
+    replay() reproduces the match exactly, as fast as the CPU allows."""
+    MAGIC = b"AGRL"
+    VERSION = 2
+    HEADER = struct.Struct("!4sBIHHHH")
+    EVENT = struct.Struct("!IBI")
+    DIGEST = struct.Struct("!20s")
+    DOWN, UP, END = 0, 1, 255
+
+    def __init__(self, path, size, seed, n_ai, spread):
+        self.file = open(path, "wb")
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, seed,
+                                            size[0], size[1], n_ai, spread))
+
+    def event(self, step, ev):
+        kind = self.DOWN if ev.type == KEYDOWN else self.UP
+        self.file.write(self.EVENT.pack(step, kind, ev.key))
+
+    def close(self, step, field):
+        self.file.write(self.EVENT.pack(step, self.END, 0))
+        self.file.write(self.DIGEST.pack(digest(field)))
+        self.file.close()
+
+def replay(path):
+    """Replays a log written by a Recorder on a headless BattleField
+    Returns the final BattleField and whether it matches the digest
+    recorded at the end of the match"""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, seed, w, h, n_ai, spread = Recorder.HEADER.unpack_from(data)
+    if magic != Recorder.MAGIC or version != Recorder.VERSION:
+        raise ValueError("{} is not an agario recording".format(path))
+    field, players = new_game((w, h), seed, n_ai, spread, headless=True)
+
+    step = 0
+    offset = Recorder.HEADER.size
+    while True:
+        at, kind, key = Recorder.EVENT.unpack_from(data, offset)
+        offset += Recorder.EVENT.size
+        while step < at:
+            field.step()
+            step += 1
+        if kind == Recorder.END:
+            break
+        ev_type = KEYDOWN if kind == Recorder.DOWN else KEYUP
+        field.handle_event(pygame.event.Event(ev_type, key=key))
+    recorded, = Recorder.DIGEST.unpack_from(data, offset)
+    return field, recorded == digest(field)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local agar.io for two")
+    parser.add_argument("ai", type=int, nargs="?", default=0,
+                        help="number of AI cells")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", metavar="FILE",
+                        help="record the match to FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="replay FILE headlessly and check its final state")
+    args = parser.parse_args()
+    # both are recorded in the fields of Recorder.HEADER
+    if args.seed is not None and not 0 <= args.seed < 2**32:
+        parser.error("--seed must be from 0 to {}".format(2**32 - 1))
+    if not 0 <= args.ai < 2**16:
+        parser.error("the number of AI cells must be from 0 to {}".format(
+                        2**16 - 1))
+
+    if args.replay:
+        field, ok = replay(args.replay)
+        print("Replayed {}: final state {}".format(args.replay,
+                        "matches" if ok else "DOES NOT MATCH"))
+        sys.exit(0 if ok else 1)
+
+    screen = pygame.display.set_mode((0,0), pygame.FULLSCREEN)
+    WIDTH = WORLD_SCALE*screen.get_width()
+    HEIGHT = WORLD_SCALE*screen.get_height()
+
+    seed = args.seed if args.seed is not None else rnd.randrange(2**32)
+    spread = screen.get_width()//6
+    BF, players = new_game((WIDTH, HEIGHT), seed, args.ai, spread)
+    recorder = None
+    if args.record:
+        recorder = Recorder(args.record, (WIDTH, HEIGHT), seed, args.ai, spread)
+
+    camera = Camera(screen.get_size(), (WIDTH, HEIGHT))
+    camera.cx, camera.cy = WIDTH/2, HEIGHT/2
+    clock = pygame.time.Clock()
+    lag = 0
+    steps = 0
+    playing = True
+    while playing:
+        lag += clock.tick(FPS)/1000
+        for ev in pygame.event.get():
+            if ev.type == QUIT:
+                playing = False
+            elif ev.type == KEYDOWN and ev.key == K_ESCAPE:
+                playing = False
+            elif ev.type in [KEYDOWN, KEYUP]:
+                BF.handle_event(ev)
+                if recorder and any(ev.key in keys for keys in PLAYER_KEYS):
+                    recorder.event(steps, ev)
+        if not playing:
+            break
+
+        # fixed timestep: catch up with the wall clock, but never by so
+        # many steps that a slow frame makes the next one even slower
+        lag = min(lag, 5*TICK)
+        while lag >= TICK:
+            BF.step()
+            steps += 1
+            lag -= TICK
+        camera.follow(players)
+        BF.draw(screen, camera)
+        pygame.display.update()
+
+    if recorder:
+        recorder.close(steps, BF)
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    main()
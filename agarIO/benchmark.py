@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Benchmarks for the hot paths of agario.py
+
+Times BattleField.update_and_draw (and each of its stages),
+BattleField.generate_food, dist and Cell.update_and_draw for
+several pellet counts, on an offscreen surface of the dummy video
+driver. The "legacy" engine is the original list-scan loop, kept
+here so new engines can be compared against it.
+
+Every run prints a table and is appended to a JSON history file:
+    python benchmark.py --pellets 100 10000 --frames 50
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import json
+import time
+import argparse
+import itertools
+import platform
+import subprocess
+import random as rnd
+
+import pygame
+import agario
+
+SCREEN = (1280, 720)
+WORLD = (agario.WORLD_SCALE*SCREEN[0], agario.WORLD_SCALE*SCREEN[1])
+N_CELLS = 50
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "benchmark_history.json")
+
+
+class LegacyField(object):
+    """The list-scan BattleField update_and_draw used to have:
+    every pellet is tested against every cell and drawn, every frame,
+    and eaten pellets are popped from the middle of a list."""
+    def __init__(self, field):
+        self.cells = field.cells
+        self.foods = [(x, y, c) for x, y, c in field.foods]
+        self.food_target = field.food_target
+        self.w, self.h = field.w, field.h
+
+    def update_and_draw(self, surf):
+        while len(self.foods) < self.food_target:
+            c = agario.get_random_colour()
+            self.foods.append((rnd.randint(0, self.w), rnd.randint(0, self.h), c))
+        surf.fill(agario.BACKGROUND)
+        i = 0
+        while i < len(self.foods):
+            x, y, c = self.foods[i]
+            for cell in self.cells:
+                if dist_ok(x, y, cell):
+                    cell.eat()
+                    self.foods.pop(i)
+                    break
+            else:
+                pygame.draw.circle(surf, c, (x, y), agario.FOOD_RADIUS)
+                i += 1
+        for cell in self.cells:
+            cell.update_and_draw(surf)
+
+def dist_ok(x, y, cell):
+    return cell.radius and agario.dist((x, y), (cell.x, cell.y)) <= cell.radius
+
+
+def make_field(pellets, seed=0, kernel=False):
+    """A world full of pellets and N_CELLS cells on scripted paths"""
+    field = agario.BattleField(WORLD, seed=seed, kernel=kernel)
+    field.food_target = pellets
+    rng = rnd.Random(seed)
+    for i in range(N_CELLS):
+        pos = (rng.randint(0, WORLD[0]), rng.randint(0, WORLD[1]))
+        # a replay of the same direction forever
+        direction = (rng.uniform(-1, 1), rng.uniform(-1, 1))
+        moves = itertools.repeat(direction)
+        field.add_cell(agario.Cell(pos, agario.get_random_colour(rng)),
+                        agario.ReplayController(moves))
+    while len(field.foods) < pellets:
+        field.generate_food()
+    return field
+
+def camera_for(field):
+    camera = agario.Camera(SCREEN, (field.w, field.h))
+    camera.cx, camera.cy = field.w/2, field.h/2
+    return camera
+
+def measure(fn, frames):
+    """Calls fn frames times; returns the mean and best seconds per call"""
+    times = []
+    for i in range(frames):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return {"mean": sum(times)/len(times), "best": min(times)}
+
+
+def bench_engine(pellets, frames, surf, kernel=False):
+    field = make_field(pellets, kernel=kernel)
+    camera = camera_for(field)
+    results = {}
+    results["update_and_draw"] = measure(
+        lambda: (field.step(), field.draw(surf, camera)), frames)
+    if kernel:
+        stages = {"kernel": lambda: field.kernel.step(field, agario.TICK)}
+    else:
+        stages = {name: getattr(field, name)
+                    for name in ["eat_food", "eat_cells", "move"]}
+    stages["spawn_food"] = field.spawn_food
+    stages["steer"] = field.steer
+    for stage, fn in stages.items():
+        results[stage] = measure(fn, frames)
+    results["draw"] = measure(lambda: field.draw(surf, camera), frames)
+    return results
+
+def bench_kernel(pellets, frames, surf):
+    return bench_engine(pellets, frames, surf, kernel=True)
+
+def bench_legacy(pellets, frames, surf):
+    field = LegacyField(make_field(pellets))
+    return {"update_and_draw": measure(lambda: field.update_and_draw(surf),
+                                        frames)}
+
+def bench_helpers(pellets, frames, surf):
+    field = make_field(pellets)
+    results = {}
+
+    def refill():
+        field.generate_food()
+        field.foods.remove(field.foods.count - 1)
+    results["generate_food"] = measure(refill, 100*frames)
+
+    a, b = (3.0, 4.0), (120.5, -7.25)
+    results["dist"] = measure(lambda: agario.dist(a, b), 1000*frames)
+
+    cell = agario.Cell((WORLD[0]/2, WORLD[1]/2), (255, 0, 0))
+    cell.vx, cell.vy = 1, 1
+    results["Cell.update_and_draw"] = measure(
+        lambda: cell.update_and_draw(surf), 100*frames)
+    return results
+
+ENGINES = {
+    "grid": bench_engine,
+    "numpy": bench_kernel,
+    "legacy": bench_legacy,
+    "helpers": bench_helpers,
+}
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+def print_table(results):
+    print("{:>8} {:>8} {:<22} {:>11} {:>11}".format(
+            "pellets", "engine", "stage", "mean ms", "best ms"))
+    for pellets, engines in results.items():
+        for engine, stages in engines.items():
+            for stage, t in stages.items():
+                print("{:>8} {:>8} {:<22} {:>11.4f} {:>11.4f}".format(
+                    pellets, engine, stage, 1000*t["mean"], 1000*t["best"]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pellets", type=int, nargs="+",
+                        default=[100, 10000, 100000])
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES),
+                        choices=list(ENGINES))
+    parser.add_argument("--history", default=HISTORY,
+                        help="JSON file the run is appended to")
+    args = parser.parse_args()
+
+    pygame.display.init()
+    surf = pygame.Surface(SCREEN)
+    results = {}
+    for pellets in args.pellets:
+        results[pellets] = {}
+        for engine in args.engines:
+            rnd.seed(0)
+            results[pellets][engine] = ENGINES[engine](pellets, args.frames, surf)
+    print_table(results)
+
+    run = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "revision": git_revision(),
+           "python": platform.python_version(),
+           "pygame": pygame.version.ver,
+           "frames": args.frames,
+           "results": results}
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+    history.append(run)
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""Authoritative network server for agario.py
+
+The server owns the only BattleField, steps it at a fixed rate and
+streams its state to every connected client. After the first full
+snapshot, a client only gets what changed in each step: the pellets
+that spawned or were eaten and the cells whose position or size
+changed, all in a compact binary encoding. The same delta bytes go to
+every client, so the cost of a tick barely grows with the audience.
+
+Messages are framed with a 4 byte big-endian length. Server to client:
+    WELCOME   type, world width, world height, id of the client's cell
+    SNAPSHOT  type, tick, counts, then the new cells (id, rgb), the
+              changed cells (id, x, y, radius), the spawned pellets
+              (x, y, rgb) and the eaten pellets (x, y)
+Client to server:
+    INPUT     type, dx, dy  (direction, -127 to 127 on each axis)
+
+    python server.py --port 7777 --bots 20
+"""
+import sys
+import struct
+import asyncio
+import argparse
+import random as rnd
+
+import numpy as np
+import agario
+
+WELCOME = 0
+SNAPSHOT = 1
+INPUT = 2
+
+FRAME = struct.Struct("!I")
+WELCOME_MSG = struct.Struct("!BHHH")
+SNAPSHOT_HEADER = struct.Struct("!BIHHII")
+INPUT_MSG = struct.Struct("!Bbb")
+
+NEW_CELL = np.dtype([("id", ">u2"), ("rgb", "u1", 3)])
+CELL = np.dtype([("id", ">u2"), ("x", ">u2"), ("y", ">u2"), ("radius", ">u2")])
+PELLET = np.dtype([("x", ">u2"), ("y", ">u2"), ("rgb", "u1", 3)])
+EATEN = np.dtype([("x", ">u2"), ("y", ">u2")])
+
+# clients that fall this many bytes behind are dropped
+MAX_BACKLOG = 1 << 20
+
+
+def encode_snapshot(tick, new_cells, cells, spawned, eaten):
+    """new_cells: [(id, rgb)], cells: [(id, x, y, radius)],
+    spawned: [(x, y, rgb)] and eaten: [(x, y)]
+    Colours are packed 0xRRGGBB integers"""
+    new = np.empty(len(new_cells), dtype=NEW_CELL)
+    for k, (i, rgb) in enumerate(new_cells):
+        new[k] = (i, agario.unpack_colour(rgb))
+    changed = np.array(cells, dtype=CELL)
+    food = np.empty(len(spawned), dtype=PELLET)
+    if spawned:
+        xs, ys, rgbs = zip(*spawned)
+        food["x"], food["y"] = xs, ys
+        rgbs = np.array(rgbs, dtype=np.uint32)
+        food["rgb"] = np.stack([rgbs >> 16, rgbs >> 8, rgbs], axis=1) & 255
+    gone = np.array(eaten, dtype=EATEN)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT, tick, len(new), len(changed),
+                                    len(food), len(gone))
+    return b"".join([header, new.tobytes(), changed.tobytes(),
+                        food.tobytes(), gone.tobytes()])
+
+def decode_snapshot(data):
+    """Inverse of encode_snapshot: returns the tick and the four
+    NumPy record arrays"""
+    _, tick, n_new, n_cells, n_spawned, n_eaten = \
+        SNAPSHOT_HEADER.unpack_from(data)
+    offset = SNAPSHOT_HEADER.size
+    parts = []
+    for dtype, n in [(NEW_CELL, n_new), (CELL, n_cells),
+                     (PELLET, n_spawned), (EATEN, n_eaten)]:
+        parts.append(np.frombuffer(data, dtype=dtype, count=n, offset=offset))
+        offset += n*dtype.itemsize
+    return (tick, *parts)
+
+def frame(payload):
+    return FRAME.pack(len(payload)) + payload
+
+async def read_frame(reader):
+    size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(size)
+
+
+class NetworkController(agario.Controller):
+    """Steers a Cell in the direction last sent by its client"""
+    def __init__(self):
+        self.direction = (0, 0)
+
+    def steer(self, cell, field):
+        cell.vx, cell.vy = self.direction
+
+
+class GameServer(object):
+    """Runs a BattleField and keeps every client's mirror of it in sync"""
+    def __init__(self, field, tick=agario.TICK):
+        self.field = field
+        self.tick = tick
+        self.ticks = 0
+        self.clients = {}
+        # cells as the clients last saw them: id -> (x, y, radius)
+        self.sent = {}
+        self.new_cells = []
+        # the tasks running handle_client
+        self.handlers = set()
+
+    def cell_state(self, i):
+        cell = self.field.cells[i]
+        return (min(max(round(cell.x), 0), 65535),
+                min(max(round(cell.y), 0), 65535),
+                min(cell.radius, 65535))
+
+    def full_snapshot(self):
+        cells = self.field.cells
+        new = [(i, agario.pack_colour(c.c)) for i, c in enumerate(cells)]
+        states = [(i, *self.cell_state(i)) for i in range(len(cells))]
+        foods = self.field.foods
+        n = foods.count
+        spawned = list(zip(foods.x[:n].tolist(), foods.y[:n].tolist(),
+                           foods.rgb[:n].tolist()))
+        return encode_snapshot(self.ticks, new, states, spawned, [])
+
+    def delta_snapshot(self):
+        changed = []
+        for i in range(len(self.field.cells)):
+            state = self.cell_state(i)
+            if self.sent.get(i) != state:
+                self.sent[i] = state
+                changed.append((i, *state))
+        new, self.new_cells = self.new_cells, []
+        return encode_snapshot(self.ticks, new, changed,
+                                self.field.spawned, self.field.eaten)
+
+    def add_player(self):
+        field = self.field
+        pos = (field.rng.randint(0, field.w), field.rng.randint(0, field.h))
+        colour = agario.get_random_colour(field.rng)
+        controller = NetworkController()
+        field.add_cell(agario.Cell(pos, colour), controller)
+        i = len(field.cells) - 1
+        self.new_cells.append((i, agario.pack_colour(colour)))
+        return i, controller
+
+    async def handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        i, controller = self.add_player()
+        writer.write(frame(WELCOME_MSG.pack(WELCOME, self.field.w,
+                                            self.field.h, i)))
+        writer.write(frame(self.full_snapshot()))
+        self.clients[i] = writer
+        try:
+            while True:
+                data = await read_frame(reader)
+                # frames that are not an INPUT are ignored
+                if len(data) == INPUT_MSG.size and data[0] == INPUT:
+                    _, dx, dy = INPUT_MSG.unpack(data)
+                    controller.direction = (dx, dy)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # the player is dropped all the same, below
+            raise
+        finally:
+            self.drop(i)
+            self.handlers.discard(task)
+
+    def drop(self, i):
+        writer = self.clients.pop(i, None)
+        if writer is None:
+            return
+        writer.close()
+        # the cell leaves the game with its player
+        self.field.cells[i].radius = 0
+        self.field.controllers[i] = agario.Controller()
+
+    def broadcast(self, payload):
+        data = frame(payload)
+        for i, writer in list(self.clients.items()):
+            if writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                self.drop(i)
+            else:
+                writer.write(data)
+
+    async def run(self, ticks=None):
+        """Steps the field every self.tick seconds, forever or for the
+        given number of ticks, and broadcasts each step's delta"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while ticks is None or self.ticks < ticks:
+            self.field.step(self.tick)
+            self.ticks += 1
+            self.broadcast(self.delta_snapshot())
+            deadline += self.tick
+            await asyncio.sleep(max(0, deadline - loop.time()))
+
+    async def serve(self, host="127.0.0.1", port=0):
+        """Starts listening; returns the asyncio Server"""
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def close(self):
+        """Stops listening and hangs up on every client, then waits for
+        their handlers to finish"""
+        self.server.close()
+        for i in list(self.clients):
+            self.drop(i)
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+
+class Mirror(object):
+    """A client's copy of the world, built from the server's snapshots"""
+    def __init__(self, w, h):
+        self.w, self.h = w, h
+        self.tick = 0
+        self.colours = {}
+        self.cells = {}
+        # (x, y) -> list of packed colours, as pellets may share a spot
+        self.pellets = {}
+
+    def apply(self, data):
+        tick, new, cells, spawned, eaten = decode_snapshot(data)
+        self.tick = tick
+        for i, rgb in zip(new["id"].tolist(), new["rgb"].tolist()):
+            self.colours[i] = tuple(rgb)
+        for i, x, y, r in cells.tolist():
+            self.cells[i] = (x, y, r)
+        for x, y, rgb in zip(spawned["x"].tolist(), spawned["y"].tolist(),
+                             spawned["rgb"].tolist()):
+            self.pellets.setdefault((x, y), []).append(agario.pack_colour(rgb))
+        for x, y in eaten.tolist():
+            here = self.pellets[(x, y)]
+            here.pop()
+            if not here:
+                del self.pellets[(x, y)]
+
+    def pellet_count(self):
+        return sum(len(here) for here in self.pellets.values())
+
+
+class BotClient(object):
+    """Connects to a GameServer and plays by heading for the nearest
+    pellet it knows about, re-planning every few ticks"""
+    def __init__(self, think_every=10, seed=None):
+        self.think_every = think_every
+        self.rng = rnd.Random(seed)
+        self.mirror = None
+        self.id = None
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        _, w, h, self.id = WELCOME_MSG.unpack(await read_frame(self.reader))
+        self.mirror = Mirror(w, h)
+
+    def send(self, dx, dy):
+        self.writer.write(frame(INPUT_MSG.pack(INPUT, dx, dy)))
+
+    def think(self):
+        me = self.mirror.cells.get(self.id)
+        if not me or not me[2]:
+            return
+        x, y, r = me
+        if self.mirror.pellets:
+            tx, ty = min(self.mirror.pellets,
+                        key=lambda p: (p[0]-x)**2 + (p[1]-y)**2)
+        else:
+            tx = self.rng.randint(0, self.mirror.w)
+            ty = self.rng.randint(0, self.mirror.h)
+        d = max(agario.dist((x, y), (tx, ty)), 1)
+        self.send(round(127*(tx-x)/d), round(127*(ty-y)/d))
+
+    async def play(self, ticks=None):
+        """Applies snapshots until the server hangs up or, if given,
+        until the mirror reaches that tick"""
+        try:
+            while ticks is None or self.mirror.tick < ticks:
+                self.mirror.apply(await read_frame(self.reader))
+                if self.mirror.tick % self.think_every == 0:
+                    self.think()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def close(self):
+        self.writer.close()
+
+
+async def run_local(n_bots, ticks, port=0, n_ai=0, size=(1280, 720), seed=None):
+    """Runs a server on localhost with n_bots bot clients for the given
+    number of ticks. Returns the server and the bots"""
+    field = agario.BattleField(size, seed=seed, headless=True)
+    field.spawn_ai(n_ai)
+    field.food_target = max(field.food_target, 10*(n_ai + n_bots))
+    server = GameServer(field)
+    listener = await server.serve("127.0.0.1", port)
+    port = listener.sockets[0].getsockname()[1]
+    bots = [BotClient(seed=k) for k in range(n_bots)]
+    for bot in bots:
+        await bot.connect("127.0.0.1", port)
+    await asyncio.gather(server.run(ticks), *[bot.play(ticks) for bot in bots])
+    for bot in bots:
+        bot.close()
+    await server.close()
+    return server, bots
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--bots", type=int, default=0,
+                        help="bot clients to connect over localhost")
+    parser.add_argument("--ai", type=int, default=0,
+                        help="AI cells run by the server itself")
+    parser.add_argument("--ticks", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    async def serve():
+        field = agario.BattleField((agario.WORLD_SCALE*1280,
+                                    agario.WORLD_SCALE*720),
+                                    seed=args.seed, headless=True)
+        field.spawn_ai(args.ai)
+        field.food_target = 100*agario.WORLD_SCALE**2
+        server = GameServer(field)
+        await server.serve(args.host, args.port)
+        bots = [BotClient(seed=k) for k in range(args.bots)]
+        for bot in bots:
+            await bot.connect(args.host, args.port)
+        try:
+            await asyncio.gather(server.run(args.ticks),
+                                 *[bot.play(args.ticks) for bot in bots])
+        finally:
+            for bot in bots:
+                bot.close()
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmarks for the neighbour lookups of minesweeper.Board
+
+Compares the NeighbourTable the Board uses against the lookup it
+used to have, which built a list of nine cells and filtered out
+itself and the ones off the board on every call. Times
+get_neighbour_coords over every cell, populate, and the flood fill
+that opens an empty board, plus building a NeighbourTable:
+    python benchmark.py --sizes 100 300 1000
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import time
+import random
+import argparse
+from collections import deque
+
+import numpy as np
+import minesweeper
+from minesweeper import Board
+
+
+class LegacyBoard(Board):
+    """A Board with the old get_neighbour_coords and the flood fill
+    that went through it"""
+    def get_neighbour_coords(self, pos):
+        neighbours = []
+        for i in [-1, 0, 1]:
+            for j in [-1, 0, 1]:
+                neighbours.append((pos[0]+i, pos[1]+j))
+        neighbours.pop(neighbours.index(pos))
+        to_remove = [i for i in range(len(neighbours))
+                if not self.on_board(*neighbours[i])]
+        while to_remove:
+            neighbours.pop(to_remove.pop())
+        return neighbours
+
+    def populate(self, click_pos):
+        invalid_positions = [click_pos] + \
+                            self.get_neighbour_coords(click_pos)
+        skip = sorted(x*self.height + y for x, y in invalid_positions)
+        rng = np.random.default_rng(random.getrandbits(64))
+        placed = rng.choice(self.width*self.height - len(skip), self.bombs,
+                            replace=False)
+        shifts = np.array(skip) - np.arange(len(skip))
+        placed += np.searchsorted(shifts, placed, side="right")
+        self.value[:] = self.count_neighbours(placed)
+
+    def flood_fill(self, x, y):
+        queued = np.zeros((self.width, self.height), dtype=bool)
+        queued[x, y] = True
+        to_show = deque([(x, y)])
+        while to_show:
+            pos = to_show.popleft()
+            for neighb in self.get_neighbour_coords(pos):
+                if queued[neighb]:
+                    continue
+                queued[neighb] = True
+                if self.set_visible(*neighb):
+                    to_show.append(neighb)
+
+
+def measure(fn, repeat):
+    """Calls fn repeat times; returns the best time in seconds"""
+    best = None
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+def bench(cls, size, repeat):
+    results = {}
+    board = cls(size, size)
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    def lookups():
+        for pos in cells:
+            board.get_neighbour_coords(pos)
+    results["neighbours"] = measure(lookups, repeat)
+
+    def populate():
+        cls(size, size, None, size*size//5).populate((size//2, size//2))
+    results["populate"] = measure(populate, repeat)
+
+    def flood():
+        # no bombs: one click opens the whole board
+        empty = cls(size, size)
+        empty.is_populated = True
+        empty.show(size//2, size//2)
+    results["flood fill"] = measure(flood, repeat)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>6} {:<12} {:>10} {:>10} {:>8}".format(
+            "size", "stage", "legacy ms", "table ms", "speedup"))
+    for size in args.sizes:
+        legacy = bench(LegacyBoard, size, args.repeat)
+        table = bench(Board, size, args.repeat)
+        for stage in legacy:
+            print("{:>6} {:<12} {:>10.2f} {:>10.2f} {:>7.1f}x".format(
+                    size, stage, 1000*legacy[stage], 1000*table[stage],
+                    legacy[stage]/table[stage]))
+        t = measure(lambda: minesweeper.NeighbourTable(size, size), args.repeat)
+        print("{:>6} {:<12} {:>10} {:>10.2f}".format(size, "table build",
+                                                    "", 1000*t))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""No-guess minefields for minesweeper.Board
+
+A board is no-guess when it can be cleared from its start cell by
+deduction alone. generate() places the mines at random and runs the
+solver with guessing turned off. While it gets stuck, instead of
+starting over, a mine is moved locally: a hidden cell next to the
+revealed area that could not be resolved is toggled between mine and
+safe, and a cell away from the revealed area is toggled the other way,
+so the number of mines stays the same. The game starts by opening the
+centre cell, which is kept free of mines along with its neighbours.
+
+Boards can be generated ahead of time across a process pool and kept
+in a cache, on disk or in memory, so a game can start right away:
+    python generator.py --width 30 --height 16 --bombs 99 --count 50
+"""
+import os
+import time
+import random
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from minesweeper import Board, HIDDEN, VISIBLE
+from solver import Solver
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "boards")
+# after this many relocations a board is thrown away and regenerated
+MAX_RELOCATIONS = 500
+
+
+def start_cell(width, height):
+    return (width//2, height//2)
+
+def deduce(value, bombs):
+    """Plays the minefield value from its start cell without guessing
+    Returns the Board as far as it got and the Solver that played it"""
+    w, h = value.shape
+    board = Board(w, h, None, bombs)
+    board.set_values(value)
+    solver = Solver(board, guessing=False)
+    solver.solve(start_cell(w, h))
+    return board, solver
+
+def near_revealed(board):
+    """Mask of the cells with a visible neighbour"""
+    visible = np.pad(board.state == VISIBLE, 1)
+    w, h = board.width, board.height
+    near = np.zeros((w, h), dtype=bool)
+    for dx in range(3):
+        for dy in range(3):
+            near |= visible[dx:dx+w, dy:dy+h]
+    return near
+
+def generate(width, height, bombs, seed=None):
+    """Returns the values of a no-guess minefield, like Board.value
+    The board is cleared by opening start_cell(width, height) first"""
+    rng = np.random.default_rng(seed)
+    x, y = start_cell(width, height)
+    safe = np.zeros((width, height), dtype=bool)
+    safe[max(x-1, 0):x+2, max(y-1, 0):y+2] = True
+    free = np.flatnonzero(~safe)
+    if bombs > len(free):
+        raise ValueError("{} bombs do not fit in a {}x{} board".format(
+                            bombs, width, height))
+    # a throwaway Board for count_neighbours
+    counter = Board(width, height)
+    while True:
+        mines = np.zeros(width*height, dtype=bool)
+        mines[rng.choice(free, bombs, replace=False)] = True
+        mines = mines.reshape(width, height)
+        for relocation in range(MAX_RELOCATIONS):
+            value = counter.count_neighbours(np.flatnonzero(mines))
+            board, solver = deduce(value, bombs)
+            if board.won:
+                return value
+            unknown = board.state == HIDDEN
+            for pos in solver.mines:
+                unknown[pos] = False
+            near = near_revealed(board)
+            stuck = np.argwhere(unknown & near)
+            # the mine (or safe cell) goes to a cell nobody knows about
+            away = unknown & ~near & ~safe
+            if not len(stuck):
+                break
+            sx, sy = stuck[rng.integers(len(stuck))]
+            others = np.argwhere(away & (mines != mines[sx, sy]))
+            if not len(others):
+                break
+            ox, oy = others[rng.integers(len(others))]
+            mines[sx, sy], mines[ox, oy] = mines[ox, oy], mines[sx, sy]
+
+def generate_many(width, height, bombs, count, processes=None, seed=None):
+    """Generates count boards across a pool of processes
+    Returns an int8 array of shape (count, width, height)"""
+    seeds = np.random.SeedSequence(seed).spawn(count)
+    with ProcessPoolExecutor(processes) as pool:
+        boards = list(pool.map(generate, [width]*count, [height]*count,
+                                [bombs]*count, seeds))
+    return np.array(boards, dtype=np.int8).reshape(count, width, height)
+
+def cache_path(width, height, bombs, directory=CACHE_DIR):
+    return os.path.join(directory, "{}x{}-{}.npy".format(width, height, bombs))
+
+
+class BoardCache(object):
+    """A supply of no-guess boards of one size and bomb count
+    Boards left from earlier runs are loaded from disk, and worker
+    processes generate more in the background so that get() rarely
+    has to wait. close() stops the workers, even halfway through a
+    board, and writes the unused boards back to disk."""
+    def __init__(self, width, height, bombs, keep=4, processes=None, path=None):
+        self.width = width
+        self.height = height
+        self.bombs = bombs
+        self.keep = keep
+        self.path = path or cache_path(width, height, bombs)
+        self.ready = deque()
+        if os.path.exists(self.path):
+            self.ready.extend(np.load(self.path))
+        # unlike a ProcessPoolExecutor, a Pool can be terminated; its
+        # workers are spawned, not forked, so that they do not inherit
+        # SDL's signal handlers, which turn SIGTERM into a quit event
+        self.pool = multiprocessing.get_context("spawn").Pool(processes)
+        self.pending = deque()
+        self.fill()
+
+    def fill(self):
+        while len(self.ready) + len(self.pending) < self.keep:
+            seed = random.getrandbits(64)
+            self.pending.append(self.pool.apply_async(generate,
+                                (self.width, self.height, self.bombs, seed)))
+
+    def collect(self):
+        while self.pending and self.pending[0].ready():
+            self.ready.append(self.pending.popleft().get())
+
+    def has_board(self):
+        """Whether get() can return without waiting"""
+        self.collect()
+        return bool(self.ready)
+
+    def get(self):
+        """Returns the values of a board, for Board.set_values"""
+        self.collect()
+        if self.ready:
+            value = self.ready.popleft()
+        else:
+            value = self.pending.popleft().get()
+        self.fill()
+        return value
+
+    def close(self):
+        for result in self.pending:
+            if result.ready():
+                self.ready.append(result.get())
+        self.pool.terminate()
+        self.pool.join()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.ready:
+            np.save(self.path, np.array(self.ready, dtype=np.int8))
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--height", type=int, default=20)
+    parser.add_argument("--bombs", type=int, default=80)
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    boards = generate_many(args.width, args.height, args.bombs, args.count,
+                            args.processes, args.seed)
+    t = time.perf_counter() - t
+    path = cache_path(args.width, args.height, args.bombs)
+    if os.path.exists(path):
+        boards = np.concatenate([np.load(path), boards])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, boards)
+    print("{} boards in {:.2f} s, {} cached in {}".format(
+            args.count, t, len(boards), path))
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,28 @@
 import os
 import sys
 import random
-import math
+import argparse
 import pygame
+import numpy as np
+from collections import deque
 from pygame.locals import *
 
-pygame.init()
-pygame.mixer.init()
-
-bomb_sound = pygame.mixer.Sound(file=r"bin\bomb.wav")
-flag_sound = pygame.mixer.Sound(file=r"bin\flag.wav")
-win_sound = pygame.mixer.Sound(file=r"bin\win.wav")
-lose_sound = pygame.mixer.Sound(file=r"bin\gameover.wav")
-
 IMAGE_REPO = "bin"
 WIDTH_PER_CELL = 18
 HEIGHT_PER_CELL = 18
 SEPARATOR_WIDTH = 2
 SEPARATOR_COLOUR = (255, 255, 255)
+FPS = 60  # the most frames per second drawn while there is activity
+# past this many changed cells a frame updates the whole display
+MAX_DIRTY_RECTS = 1000
+# the window never grows past this; bigger boards scroll
+MAX_WINDOW = (1280, 800)
+# zoom levels of the Viewport, and pixels scrolled per key press
+ZOOMS = [0.25, 0.5, 0.75, 1, 1.5, 2, 3]
+SCROLL_STEP = 60
+# values of the cells of Board.state; Board.value is 0-8 or BOMB
+HIDDEN, VISIBLE, FLAGGED = 0, 1, 2
+BOMB = 9
 
 def load_image(name, transparent=False):
     """Function that handles image loading
@@ -33,282 +38,557 @@ def load_image(name, transparent=False):
 
     return img, img_rect
 
-class Cell(object):
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.value = 0
-        self.state = "hidden"
-        
-    def set_bomb(self):
-        self.value = 9
-        
-    def tick(self):
-        self.value = self.value + 1 if self.value < 9 else 9
-        
-    def set_hidden(self):
-        self.state = "hidden"
-        self.set_image()
-        
-    def set_visible(self, override=False):
-        if override or self.state == "hidden":
-            self.state = "visible"
-            self.set_image()
-            if self.value == 9:
-                if bomb_sound.get_num_channels() < 1:
-                    bomb_sound.play()
-            
-        return self.value == 0
-        
-    def is_visible(self):
-        return self.state == "visible"
-        
-    def is_flagged(self):
-        return self.state == "flagged"
-        
-    def is_hidden(self):
-        return self.state == "hidden"
-        
-    def get_number(self):
-        return self.value
-        
-    def flip_flag(self, flags):
-        if self.state == "flagged":
-            flags += 1
-            self.state = "hidden"
-            flag_sound.play()
-        elif self.state == "hidden" and flags:
-            flags -= 1
-            self.state = "flagged"
-            flag_sound.play()
-        self.set_image()
-        return flags
-    
-    def is_bomb(self):
-        return self.value == 9
-        
-    def set_image(self):
-        if self.state in ["hidden", "flagged"]:
-            self.image = image_dict[self.state]
-        else:
-            self.image = image_dict[self.value]
-        
-    def __str__(self):
-        return "<Cell @{}>".format(self.value)
-        
-    def __repr__(self):
-        return self.__str__()
-        
+# filled in by load_images and load_sounds; a Board without a frame
+# (e.g. one played by the solver) needs neither
+image_dict = {}
+sounds = {}
+
+def load_images():
+    for i in range(1, 9):
+        imagepath = os.path.join(IMAGE_REPO, str(i)+".png")
+        image, rect = load_image(imagepath)
+        image_dict[i] = image
+    image, rect = load_image(os.path.join(IMAGE_REPO, "bomb.png"))
+    image_dict[9] = image
+    image, rect = load_image(os.path.join(IMAGE_REPO, "background.png"))
+    image_dict[0] = image
+    image, rect = load_image(os.path.join(IMAGE_REPO, "flag.png"))
+    image_dict["flagged"] = image
+    image, rect = load_image(os.path.join(IMAGE_REPO, "hidden.png"))
+    image_dict["hidden"] = image
+
+def load_sounds():
+    for name, filename in [("bomb", "bomb.wav"), ("flag", "flag.wav"),
+                           ("win", "win.wav"), ("lose", "gameover.wav")]:
+        path = os.path.join(IMAGE_REPO, filename)
+        sounds[name] = pygame.mixer.Sound(file=path)
+
+def play_sound(name, overlap=True):
+    """Plays one of the loaded sounds, if any; with overlap=False
+    it is not played again while it is still playing"""
+    sound = sounds.get(name)
+    if sound and (overlap or sound.get_num_channels() < 1):
+        sound.play()
+
+# the eight steps to the neighbours of a cell, in reading order
+STEPS = [(i, j) for i in [-1, 0, 1] for j in [-1, 0, 1] if i or j]
+
+class NeighbourTable(object):
+    """The neighbours of every cell of a width x height board
+    Cells are numbered x*height + y. Each cell has a border kind, a
+    bitmask of the borders it touches (1 and 2 for the first and last
+    x, 4 and 8 for the first and last y), stored one byte per cell in
+    kind. For every kind, deltas lists the (dx, dy) steps that stay
+    on the board and offsets the same steps as flat int32 offsets."""
+    def __init__(self, width, height):
+        self.height = height
+        xs, ys = np.arange(width), np.arange(height)
+        x_borders = (xs == 0) | (xs == width-1)*2
+        y_borders = (ys == 0)*4 | (ys == height-1)*8
+        kind = x_borders[:, None] | y_borders[None, :]
+        self.kind = kind.astype(np.uint8).tobytes()
+        self.deltas = []
+        self.offsets = []
+        for k in range(16):
+            deltas = [(dx, dy) for dx, dy in STEPS
+                        if not (dx == -1 and k & 1 or dx == 1 and k & 2 or
+                                dy == -1 and k & 4 or dy == 1 and k & 8)]
+            self.deltas.append(deltas)
+            self.offsets.append(np.array([dx*height + dy for dx, dy in deltas],
+                                        dtype=np.int32))
+        # plain ints iterate faster than the arrays
+        self.steps = [tuple(offsets.tolist()) for offsets in self.offsets]
+
+    def coords(self, x, y):
+        return [(x+dx, y+dy) for dx, dy in self.deltas[self.kind[x*self.height + y]]]
+
+    def flat(self, i):
+        return [i+step for step in self.steps[self.kind[i]]]
+
+# shared by every Board of the same size
+neighbour_tables = {}
+
+def get_neighbour_table(width, height):
+    table = neighbour_tables.get((width, height))
+    if table is None:
+        table = neighbour_tables[width, height] = NeighbourTable(width, height)
+    return table
+
+class Viewport(object):
+    """The part of a Board that the window shows
+    At a zoom z the cells are z times their usual size, and (left, top)
+    is the pixel of the zoomed board at the window's top left corner.
+    The cell images are scaled once per zoom level and cached."""
+    def __init__(self, screen_size, columns, rows, zoom=1):
+        self.w, self.h = screen_size
+        self.columns, self.rows = columns, rows
+        self.left = self.top = 0
+        self.scaled = {}
+        self.set_zoom(zoom)
+
+    def set_zoom(self, zoom):
+        self.zoom = zoom
+        self.cell_w = max(1, round(WIDTH_PER_CELL*zoom))
+        self.cell_h = max(1, round(HEIGHT_PER_CELL*zoom))
+        self.sep = max(1, round(SEPARATOR_WIDTH*zoom))
+        self.pitch_x = self.cell_w + self.sep
+        self.pitch_y = self.cell_h + self.sep
+        self.scroll(0, 0)
+
+    def board_size(self):
+        return (self.sep + self.columns*self.pitch_x,
+                self.sep + self.rows*self.pitch_y)
+
+    def scroll(self, dx, dy):
+        board_w, board_h = self.board_size()
+        self.left = min(max(self.left + dx, 0), max(board_w - self.w, 0))
+        self.top = min(max(self.top + dy, 0), max(board_h - self.h, 0))
+
+    def zoom_by(self, steps, pos):
+        """Goes steps zoom levels in (or out, if negative), keeping
+        the point of the board under pos in place
+        Returns whether the zoom changed"""
+        level = min(range(len(ZOOMS)), key=lambda k: abs(ZOOMS[k] - self.zoom))
+        zoom = ZOOMS[min(max(level + steps, 0), len(ZOOMS) - 1)]
+        if zoom == self.zoom:
+            return False
+        # the point under pos, in cells
+        cx = (self.left + pos[0])/self.pitch_x
+        cy = (self.top + pos[1])/self.pitch_y
+        self.set_zoom(zoom)
+        self.left = round(cx*self.pitch_x) - pos[0]
+        self.top = round(cy*self.pitch_y) - pos[1]
+        self.scroll(0, 0)
+        return True
+
+    def cells(self):
+        """Returns the ranges of the columns and rows on screen"""
+        # cell k spans sep + k*pitch to (k+1)*pitch, minus the scroll
+        right = self.left + self.w - self.sep
+        bottom = self.top + self.h - self.sep
+        return (range(self.left//self.pitch_x,
+                      min(-(-right//self.pitch_x), self.columns)),
+                range(self.top//self.pitch_y,
+                      min(-(-bottom//self.pitch_y), self.rows)))
+
+    def cell_rect(self, x, y):
+        return pygame.Rect(self.sep + x*self.pitch_x - self.left,
+                           self.sep + y*self.pitch_y - self.top,
+                           self.cell_w, self.cell_h)
+
+    def cell_at(self, pos):
+        return ((self.left + pos[0])//self.pitch_x,
+                (self.top + pos[1])//self.pitch_y)
+
+    def image(self, key):
+        """Returns image_dict[key] at the current zoom"""
+        images = self.scaled.setdefault(self.zoom, {})
+        image = images.get(key)
+        if image is None:
+            image = image_dict[key]
+            if image.get_size() != (self.cell_w, self.cell_h):
+                image = pygame.transform.smoothscale(image,
+                                                    (self.cell_w, self.cell_h))
+            images[key] = image
+        return image
+
 class Board(object):
-    def __init__(self, size, frame):
+    """The minefield, as two small-integer arrays indexed by [x, y]:
+    value holds the number of neighbouring bombs (BOMB for a bomb)
+    and state says whether the cell is HIDDEN, VISIBLE or FLAGGED.
+    Two bytes per cell let very large boards fit in memory."""
+    def __init__(self, width, height, frame=None, bombs=0):
         self.frame = frame
-        self.size = size
-        self.board = [[None for i in range(size)] for j in range(size)]
-        for r in range(size):
-            for c in range(size):
-                self.board[r][c] = Cell(c, r)
-                self.board[r][c].set_hidden()
+        self.width = width
+        self.height = height
+        self.bombs = bombs
+        self.flags = bombs
+        self.playing = True
+        self.won = False
+        self.value = np.zeros((width, height), dtype=np.int8)
+        self.state = np.full((width, height), HIDDEN, dtype=np.int8)
+        self.neighbours = get_neighbour_table(width, height)
+        # the part of the board in the window, if there is one
+        self.view = None
+        if frame is not None:
+            self.view = Viewport(frame.get_size(), width, height)
         self.is_populated = False
+        # cells whose image changed since the last draw_dirty()
+        self.dirty = []
+        # running counts for check_if_win: safe cells shown so far
+        # and flags sitting on top of bombs
+        self.revealed = 0
+        self.correct_flags = 0
                 
     def populate(self, click_pos):
-        invalid_positions = [click_pos] + \
-                            self.get_neighbour_coords(click_pos)
-        placed = []
-        side = self.size
-        while len(placed) < self.bombs:
-            pos = (random.randint(0, side-1), random.randint(0, side-1))
-            # check for duplicates
-            if pos in placed or pos in invalid_positions:
-                continue
-            else:
-                placed.append(pos)
-                
-            self.board[pos[0]][pos[1]].set_bomb()
-            neighbs = self.get_neighbour_coords(pos)
-            for coords in neighbs:
-                self.board[coords[0]][coords[1]].tick()
+        # cell (x, y) is number x*height + y; sample without replacement
+        # from the numbers that are left once the safe ones are skipped
+        click = click_pos[0]*self.height + click_pos[1]
+        skip = sorted([click] + self.neighbours.flat(click))
+        # seeded from random so that random.seed still fixes boards
+        rng = np.random.default_rng(random.getrandbits(64))
+        placed = rng.choice(self.width*self.height - len(skip), self.bombs,
+                            replace=False)
+        # the i-th safe cell shifts every number from skip[i] - i on
+        shifts = np.array(skip) - np.arange(len(skip))
+        placed += np.searchsorted(shifts, placed, side="right")
+        self.value[:] = self.count_neighbours(placed)
+
+    def set_values(self, value):
+        """Uses an already generated minefield instead of populating
+        one on the first click (see generator.py)"""
+        self.value[:] = value
+        self.is_populated = True
+
+    def count_neighbours(self, placed):
+        """Returns the array of cell values for the mines in placed:
+        9 for a mine, else the number of mines around it. The counts
+        are a 3x3 convolution of the mine mask, done with shifted sums"""
+        w, h = self.width, self.height
+        mines = np.zeros(w*h, dtype=np.int8)
+        mines[placed] = 1
+        mines = mines.reshape(w, h)
+        padded = np.pad(mines, 1)
+        counts = np.zeros((w, h), dtype=np.int8)
+        for dx in range(3):
+            for dy in range(3):
+                counts += padded[dx:dx+w, dy:dy+h]
+        counts -= mines
+        counts[mines == 1] = BOMB
+        return counts
+
+    def set_visible(self, x, y, override=False):
+        """Shows the cell (x, y)
+        Returns True if a hidden empty cell was shown, whose
+        neighbours have to be shown too"""
+        state = self.state[x, y]
+        if override or state == HIDDEN:
+            self.state[x, y] = VISIBLE
+            self.dirty.append((x, y))
+            if self.value[x, y] == BOMB:
+                if state == FLAGGED:
+                    self.correct_flags -= 1
+                play_sound("bomb", overlap=False)
+            elif state != VISIBLE:
+                self.revealed += 1
+
+        return state == HIDDEN and self.value[x, y] == 0
+
+    def is_visible(self, x, y):
+        return self.state[x, y] == VISIBLE
+
+    def is_flagged(self, x, y):
+        return self.state[x, y] == FLAGGED
+
+    def is_hidden(self, x, y):
+        return self.state[x, y] == HIDDEN
+
+    def get_number(self, x, y):
+        return int(self.value[x, y])
+
+    def is_bomb(self, x, y):
+        return self.value[x, y] == BOMB
+
+    def flip_flag(self, x, y):
+        if self.state[x, y] == FLAGGED:
+            self.flags += 1
+            self.state[x, y] = HIDDEN
+            self.dirty.append((x, y))
+            if self.value[x, y] == BOMB:
+                self.correct_flags -= 1
+            play_sound("flag")
+        elif self.state[x, y] == HIDDEN and self.flags:
+            self.flags -= 1
+            self.state[x, y] = FLAGGED
+            self.dirty.append((x, y))
+            if self.value[x, y] == BOMB:
+                self.correct_flags += 1
+            play_sound("flag")
+
+    def get_image_key(self, x, y):
+        if self.state[x, y] == HIDDEN:
+            return "hidden"
+        elif self.state[x, y] == FLAGGED:
+            return "flagged"
+        return int(self.value[x, y])
+
+    def get_image(self, x, y):
+        return image_dict[self.get_image_key(x, y)]
                 
     def init_GUI(self):
-        y = 0
-        for i in range(self.size+1):
-            x = i * (WIDTH_PER_CELL + SEPARATOR_WIDTH)
-            pygame.draw.line(self.frame, SEPARATOR_COLOUR, (x, y),
-                            (x, HEIGHT), SEPARATOR_WIDTH)
-                    
-        x = 0
-        for j in range(self.size+1):
-            y = j * (WIDTH_PER_CELL + SEPARATOR_WIDTH)
-            pygame.draw.line(self.frame, SEPARATOR_COLOUR, (x, y),
-                            (WIDTH, y), SEPARATOR_WIDTH)
+        # the separators are whatever the cells leave uncovered
+        self.frame.fill(SEPARATOR_COLOUR)
                             
     def draw(self):
-        x_spacing = WIDTH_PER_CELL + SEPARATOR_WIDTH
-        y_spacing = HEIGHT_PER_CELL + SEPARATOR_WIDTH
-        for i in range(self.size):
-            for j in range(self.size):
-                x = SEPARATOR_WIDTH + i*x_spacing
-                y = SEPARATOR_WIDTH + j*y_spacing
-                self.frame.blit(self.board[i][j].image, (x,y))
+        """Draws the cells in the viewport, and only those"""
+        self.init_GUI()
+        columns, rows = self.view.cells()
+        for i in columns:
+            for j in rows:
+                self.frame.blit(self.view.image(self.get_image_key(i, j)),
+                                self.view.cell_rect(i, j))
+        self.dirty = []
+
+    def get_cell_rect(self, x, y):
+        return self.view.cell_rect(x, y)
+
+    def draw_dirty(self):
+        """Blits only the cells that changed since the last draw
+        Returns the list of Rects of the screen that changed"""
+        screen = self.frame.get_rect()
+        if len(self.dirty) > MAX_DIRTY_RECTS:
+            # cheaper to redraw the cells on screen than to go through
+            # a big opening, or every bomb of a lost game, one by one
+            self.draw()
+            return [screen]
+        rects = []
+        for x, y in self.dirty:
+            rect = self.get_cell_rect(x, y)
+            if rect.colliderect(screen):
+                self.frame.blit(self.view.image(self.get_image_key(x, y)), rect)
+                rects.append(rect)
+        self.dirty = []
+        return rects
+
+    def on_board(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
                 
     def left_click(self, pos):
         x, y = self.get_indexes(pos)
-        self.show(x, y)
+        if self.on_board(x, y):
+            self.show(x, y)
                 
     def show(self, x, y):
         if not self.is_populated:
             self.populate((x, y))
             self.is_populated = True
     
-        # do nothing if we want to open a flag
-        if self.board[x][y].is_flagged():
+        # do nothing if we want to open a flag or an open cell
+        if not self.is_hidden(x, y):
             return
             
-        show_more = self.board[x][y].set_visible()
-        if self.board[x][y].is_bomb():
+        show_more = self.set_visible(x, y)
+        if self.is_bomb(x, y):
             self.lose_game()
         
-        shown = [(x,y)]
         if show_more:
-            to_show = self.get_neighbour_coords((x,y))
-            while to_show:
-                pos = to_show[0]
-                shown.append(pos)
-                to_show = to_show[1:]
-                show_more = self.board[pos[0]][pos[1]].set_visible()
-                if show_more:
-                    neighbs = self.get_neighbour_coords(pos)
-                    for neighb in neighbs:
-                        if neighb not in shown and neighb not in to_show:
-                            to_show.append(neighb)
+            self.flood_fill(x, y)
         
         self.check_if_win()
         
+    def flood_fill(self, x, y):
+        """Shows everything reachable from the empty cell (x, y)
+        A cell is queued only by the set_visible that shows it, so each
+        cell enters the queue at most once and the cost is linear in
+        the number of cells revealed, whatever the size of the board"""
+        h = self.height
+        kind, steps = self.neighbours.kind, self.neighbours.steps
+        # cells are numbered x*h + y, as in the NeighbourTable
+        start = x*h + y
+        # grows with the cells looked at, not with the board
+        seen = {start}
+        to_show = deque([start])
+        while to_show:
+            i = to_show.popleft()
+            for step in steps[kind[i]]:
+                n = i + step
+                if n in seen:
+                    continue
+                seen.add(n)
+                if self.set_visible(*divmod(n, h)):
+                    to_show.append(n)
+
     def right_click(self, pos):
         x, y = self.get_indexes(pos)
+        if not self.on_board(x, y):
+            return
         
         # should we clear surrounding cells or clear flags?
-        if self.board[x][y].is_visible():
+        if self.is_visible(x, y):
             self.clear(x, y)
         else:
             self.flag(x, y)
             
     def flag(self, x, y):
-        self.flags = self.board[x][y].flip_flag(self.flags)
+        self.flip_flag(x, y)
         
         self.check_if_win()
         
     def clear(self, x, y):
-        num = self.board[x][y].get_number()
+        num = self.get_number(x, y)
         if 1 <= num <= 8:
             neighbs = self.get_neighbour_coords((x,y))
             count = 0
             for (x, y) in neighbs:
-                if self.board[x][y].is_flagged():
+                if self.is_flagged(x, y):
                     count += 1
             if count == num:
                 for neighb in neighbs:
                     self.show(*neighb)
         
     def check_if_win(self):
-        if self.flags == 0:
-            count = 0
-            for i in range(self.size):
-                for j in range(self.size):
-                    if self.board[i][j].state == "visible":
-                        count += 1
-            if count == self.size*self.size - self.bombs:
-                self.win_game()
+        # every bomb flagged (so no flags left) and every safe cell shown
+        if (self.correct_flags == self.bombs and
+                self.revealed == self.width*self.height - self.bombs):
+            self.win_game()
         
     def get_indexes(self, pos):
-        x_, y_ = pos
-        x = math.floor(x_ / (WIDTH_PER_CELL + SEPARATOR_WIDTH))
-        y = math.floor(y_ / (HEIGHT_PER_CELL + SEPARATOR_WIDTH))
-        
-        return (x, y)
+        return self.view.cell_at(pos)
                 
     def get_neighbour_coords(self, pos):
-        side = self.size
-        neighbours = []
-        for i in [-1, 0, 1]:
-            for j in [-1, 0, 1]:
-                neighbours.append((pos[0]+i, pos[1]+j))
-        ## remove itself
-        neighbours.pop(neighbours.index(pos))
-        
-        ## find all the pairs which are too far to the left/right
-        ## or to far to the top/bottom i.e. out of board
-        to_remove = [i for i in range(len(neighbours))
-                if (-1 in neighbours[i] or side in neighbours[i])]
-        while to_remove:
-            neighbours.pop(to_remove.pop())
-            
-        return neighbours
+        return self.neighbours.coords(*pos)
         
     def lose_game(self):
-        global to_play
-        to_play = False
+        self.playing = False
+        bombs = self.value == BOMB
+        self.correct_flags -= np.count_nonzero(self.state[bombs] == FLAGGED)
+        self.state[bombs] = VISIBLE
+        self.dirty.extend(map(tuple, np.argwhere(bombs).tolist()))
+        if self.frame is None:
+            return
         print("You lost!!")
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.board[i][j].is_bomb():
-                    self.board[i][j].set_visible(override=True)
+        play_sound("bomb", overlap=False)
         pygame.display.set_caption("You lost!! :(")
         pygame.mixer.fadeout(1000)
-        lose_sound.play()
+        play_sound("lose")
                     
     def win_game(self):
-        global to_play
-        to_play = False
+        self.playing = False
+        self.won = True
+        if self.frame is None:
+            return
         print("You won!!")
         pygame.display.set_caption("You won!! :)")
-        win_sound.play()
+        play_sound("win")
         
     def __str__(self):
         s = ""
-        for line in self.board:
+        for line in self.value.tolist():
             s += str(line) + "\n"
         return s
             
-n = 20
-        
-WIDTH = n * WIDTH_PER_CELL + (n+1) * SEPARATOR_WIDTH
-HEIGHT = n * HEIGHT_PER_CELL + (n+1) * SEPARATOR_WIDTH
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
+def main():
+    parser = argparse.ArgumentParser(description="Minesweeper")
+    parser.add_argument("--width", type=int, default=20, help="in cells")
+    parser.add_argument("--height", type=int, default=20, help="in cells")
+    parser.add_argument("--mines", type=int, default=None,
+                        help="defaults to a fifth of the cells")
+    parser.add_argument("--window", type=int, nargs=2, metavar=("W", "H"),
+                        help="window size in pixels; fits the board by "
+                             "default, up to {}x{}".format(*MAX_WINDOW))
+    parser.add_argument("--zoom", type=float, default=1, choices=ZOOMS)
+    parser.add_argument("--no-guess", action="store_true",
+                        help="play a board that never needs a guess")
+    parser.add_argument("--load", metavar="PATH",
+                        help="resume the game saved in PATH")
+    parser.add_argument("--save", metavar="PATH",
+                        help="save the game to PATH when the window closes")
+    args = parser.parse_args()
+    if args.width < 1 or args.height < 1:
+        parser.error("the board needs at least one cell")
+    # the first click and its neighbours are kept free of mines
+    most = args.width*args.height - min(args.width, 3)*min(args.height, 3)
+    if args.mines is not None and not 0 <= args.mines <= most:
+        parser.error("a {}x{} board takes 0 to {} mines".format(
+                        args.width, args.height, most))
+    if args.load or args.save:
+        import savegame
+
+    pygame.init()
+    pygame.mixer.init()
+    load_sounds()
+
+    w, h = args.width, args.height
+    mines = args.mines if args.mines is not None else int(w*h*0.2)
+    saved = None
+    if args.load:
+        saved = savegame.SavedGame(args.load)
+        w, h, mines = saved.width, saved.height, saved.bombs
+
+    if args.window:
+        size = args.window
+    else:
+        view = Viewport((0, 0), w, h, args.zoom)
+        size = [min(a, b) for a, b in zip(view.board_size(), MAX_WINDOW)]
+    screen = pygame.display.set_mode(size)
+    load_images()
+
+    cache = None
+    b = Board(w, h, screen, mines)
+    if saved:
+        saved.restore(b)
+        saved.close()
+    elif args.no_guess:
+        import generator
+        # keeps a spare board on disk for the next game
+        cache = generator.BoardCache(w, h, mines, keep=2)
+        if not cache.has_board():
+            # the first board of a size takes a while; stay responsive
+            caption = pygame.display.get_caption()[0]
+            pygame.display.set_caption("Generating a board...")
+            pygame.display.update()
+            while not cache.has_board():
+                for ev in pygame.event.get():
+                    if ev.type == pygame.QUIT:
+                        cache.close()
+                        pygame.quit()
+                        sys.exit()
+                pygame.time.wait(100)
+            pygame.display.set_caption(caption)
+        b.set_values(cache.get())
+        b.show(*generator.start_cell(w, h))
+    b.view.set_zoom(args.zoom)
 
-image_dict = {}
-for i in range(1, 9):
-    imagepath = os.path.join(IMAGE_REPO, str(i)+".png")
-    image, rect = load_image(imagepath)
-    image_dict[i] = image
-image, rect = load_image(os.path.join(IMAGE_REPO, "bomb.png"))
-image_dict[9] = image
-image, rect = load_image(os.path.join(IMAGE_REPO, "background.png"))
-image_dict[0] = image
-image, rect = load_image(os.path.join(IMAGE_REPO, "flag.png"))
-image_dict["flagged"] = image
-image, rect = load_image(os.path.join(IMAGE_REPO, "hidden.png"))
-image_dict["hidden"] = image
-
-b = Board(n, screen)
-b.bombs = int(n*n*0.2)
-b.flags = b.bombs
-
-b.init_GUI()
-
-to_play = True
-
-while True:
-    for ev in pygame.event.get():
-        if ev.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-            
-        ## button == 1 is the left button and 3 is the right one
-        elif to_play and ev.type == MOUSEBUTTONDOWN:
-            if ev.button == 1:
-                b.left_click(ev.pos)
-            elif ev.button == 3:
-                b.right_click(ev.pos)
-        
     b.draw()
-    pygame.display.update()
\ No newline at end of file
+    pygame.display.update()
+    # arrow keys scroll for as long as they are held
+    pygame.key.set_repeat(200, 30)
+    arrows = {K_LEFT: (-1, 0), K_RIGHT: (1, 0), K_UP: (0, -1), K_DOWN: (0, 1)}
+
+    clock = pygame.time.Clock()
+    while True:
+        # sleep until something happens, so an idle board costs no CPU
+        moved = False
+        for ev in [pygame.event.wait()] + pygame.event.get():
+            if ev.type == pygame.QUIT:
+                if cache:
+                    cache.close()
+                if args.save:
+                    savegame.save(b, args.save)
+                pygame.quit()
+                sys.exit()
+
+            ## button == 1 is the left button and 3 is the right one
+            elif b.playing and ev.type == MOUSEBUTTONDOWN:
+                if ev.button == 1:
+                    b.left_click(ev.pos)
+                elif ev.button == 3:
+                    b.right_click(ev.pos)
+
+            # the wheel zooms, dragging with the middle button scrolls
+            elif ev.type == MOUSEWHEEL:
+                moved |= b.view.zoom_by(ev.y, pygame.mouse.get_pos())
+            elif ev.type == MOUSEMOTION and ev.buttons[1]:
+                b.view.scroll(-ev.rel[0], -ev.rel[1])
+                moved = True
+            elif ev.type == KEYDOWN:
+                if ev.key in arrows:
+                    dx, dy = arrows[ev.key]
+                    b.view.scroll(dx*SCROLL_STEP, dy*SCROLL_STEP)
+                    moved = True
+                elif ev.key in (K_PLUS, K_EQUALS, K_KP_PLUS):
+                    moved |= b.view.zoom_by(1, screen.get_rect().center)
+                elif ev.key in (K_MINUS, K_KP_MINUS):
+                    moved |= b.view.zoom_by(-1, screen.get_rect().center)
+
+        if moved:
+            b.draw()
+            pygame.display.update()
+        else:
+            rects = b.draw_dirty()
+            if rects:
+                pygame.display.update(rects)
+        clock.tick(FPS)
+
+if __name__ == "__main__":
+    main()
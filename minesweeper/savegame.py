@@ -0,0 +1,121 @@
+"""Saving and resuming minesweeper games
+
+A saved game is a header followed by the board, packed:
+    header  magic b"MSWP", version, width, height, bombs and a byte of
+            status bits (populated, playing, won), big-endian
+    values  4 bits per cell (0-8, or BOMB), two cells per byte
+    states  2 bits per cell (HIDDEN, VISIBLE or FLAGGED), four per byte
+Cells are in Board order, x*height + y, the first cell in the high
+bits. A 1000x1000 board takes 750 kB.
+
+Saved games are opened through mmap: SavedGame decodes only the rows
+it is asked for, so only those pages of a huge file are read.
+"""
+import mmap
+import struct
+
+import numpy as np
+from minesweeper import Board, VISIBLE, FLAGGED, BOMB
+
+MAGIC = b"MSWP"
+VERSION = 1
+HEADER = struct.Struct("!4sBIIIB")
+POPULATED, PLAYING, WON = 1, 2, 4
+
+
+def pack(cells, bits):
+    """Packs an array of small ints, 8//bits to a byte"""
+    per_byte = 8//bits
+    cells = cells.astype(np.uint8).reshape(-1)
+    padded = np.zeros(-(-len(cells)//per_byte)*per_byte, dtype=np.uint8)
+    padded[:len(cells)] = cells
+    padded = padded.reshape(-1, per_byte)
+    packed = np.zeros(len(padded), dtype=np.uint8)
+    for k in range(per_byte):
+        packed |= padded[:, k] << (8 - bits*(k+1))
+    return packed
+
+def unpack(packed, bits, start, stop):
+    """Inverse of pack for the cells start to stop, given the bytes
+    packed from cell start//(8//bits)*(8//bits) on"""
+    per_byte = 8//bits
+    mask = (1 << bits) - 1
+    first, last = start//per_byte, -(-stop//per_byte)
+    data = np.asarray(packed[:last - first])
+    cells = np.empty((len(data), per_byte), dtype=np.int8)
+    for k in range(per_byte):
+        cells[:, k] = (data >> (8 - bits*(k+1))) & mask
+    offset = start - first*per_byte
+    return cells.reshape(-1)[offset:offset + stop - start]
+
+def save(board, path):
+    status = (POPULATED*board.is_populated | PLAYING*board.playing |
+              WON*board.won)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, board.width, board.height,
+                            board.bombs, status))
+        f.write(pack(board.value, 4).tobytes())
+        f.write(pack(board.state, 2).tobytes())
+
+
+class SavedGame(object):
+    """A saved game, memory-mapped
+    rows(start, stop) decodes part of the board, board() and
+    restore(board) all of it"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.height, self.bombs, self.status = \
+            HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(path + " is not a saved minesweeper game")
+        n = self.width*self.height
+        value_bytes = -(-n//2)
+        # views into the file; nothing is read until they are indexed
+        self.values = np.frombuffer(self.mm, dtype=np.uint8,
+                                    count=value_bytes, offset=HEADER.size)
+        self.states = np.frombuffer(self.mm, dtype=np.uint8, count=-(-n//4),
+                                    offset=HEADER.size + value_bytes)
+
+    def rows(self, start, stop):
+        """Returns the values and the states of the rows start to stop
+        (the cells with x in that range) as int8 arrays"""
+        a, b = start*self.height, stop*self.height
+        value = unpack(self.values[a//2:], 4, a, b)
+        state = unpack(self.states[a//4:], 2, a, b)
+        shape = (stop - start, self.height)
+        return value.reshape(shape), state.reshape(shape)
+
+    def board(self, frame=None):
+        """Returns a Board to resume the game with"""
+        return self.restore(Board(self.width, self.height, frame, self.bombs))
+
+    def restore(self, board):
+        """Puts the saved game into a new Board of the same size
+        Returns the board"""
+        value, state = self.rows(0, self.width)
+        board.value[:] = value
+        board.state[:] = state
+        board.is_populated = bool(self.status & POPULATED)
+        board.playing = bool(self.status & PLAYING)
+        board.won = bool(self.status & WON)
+        bombs = board.value == BOMB
+        flagged = board.state == FLAGGED
+        board.flags = self.bombs - np.count_nonzero(flagged)
+        board.revealed = np.count_nonzero((board.state == VISIBLE) & ~bombs)
+        board.correct_flags = np.count_nonzero(flagged & bombs)
+        return board
+
+    def close(self):
+        # the views have to go before the map can be closed
+        del self.values, self.states
+        self.mm.close()
+
+def load(path, frame=None):
+    """Returns the Board saved in path"""
+    game = SavedGame(path)
+    try:
+        return game.board(frame)
+    finally:
+        game.close()
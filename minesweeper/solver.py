@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""Headless solver for minesweeper.Board, with a benchmark harness
+
+The solver only looks at what a player sees: the numbers of the
+visible cells. It opens the centre of the board, then repeats:
+    - single-cell deductions: a number whose mines are all flagged
+      makes its other hidden neighbours safe, and a number with as
+      many hidden neighbours as missing mines makes them all mines;
+    - subset deductions: if the hidden neighbours of a number are a
+      subset of another's, the difference holds the difference of
+      their missing mines;
+    - when stuck, exact probabilities: the frontier (hidden cells next
+      to numbers) is split into independent components, each one is
+      enumerated, and the counts are combined with the number of ways
+      to place the remaining mines in the cells away from the frontier.
+      Cells that are certainly safe or mines are played as such, else
+      the cell least likely to be a mine is opened.
+
+    python solver.py --sizes 9 16 30 100 --densities 0.206 --games 100
+"""
+import math
+import time
+import random
+import argparse
+from collections import deque
+
+from minesweeper import Board, HIDDEN, VISIBLE
+
+# components bigger than this many cells are not enumerated exactly
+MAX_COMPONENT = 60
+# nor are the ones whose enumeration visits more than this many nodes
+MAX_NODES = 200000
+
+
+class Solver(object):
+    """Plays a Board to the end; solve() returns whether it was won
+    With guessing=False it stops instead of taking a risk"""
+    def __init__(self, board, rng=None, guessing=True):
+        self.board = board
+        self.guessing = guessing
+        self.rng = rng or random.Random()
+        self.neighbours = {}
+        # cells known to be mines (and flagged) and known to be safe
+        self.mines = set()
+        self.safe = deque()
+        self.safe_set = set()
+        # visible numbers with hidden neighbours, and the ones among
+        # them that changed since they were last looked at
+        self.frontier = set()
+        self.todo = set()
+        self.guesses = 0
+
+    def get_neighbours(self, pos):
+        nbs = self.neighbours.get(pos)
+        if nbs is None:
+            nbs = self.neighbours[pos] = self.board.get_neighbour_coords(pos)
+        return nbs
+
+    def solve(self, first=None):
+        board = self.board
+        if first is None:
+            first = (board.width//2, board.height//2)
+        self.reveal(first)
+        while board.playing:
+            if self.safe:
+                pos = self.safe.popleft()
+                self.safe_set.discard(pos)
+                if board.state[pos] == HIDDEN:
+                    self.reveal(pos)
+            elif self.todo:
+                self.single_pass()
+            elif board.revealed == board.width*board.height - board.bombs:
+                # only mines are left hidden
+                for pos in zip(*(board.state == HIDDEN).nonzero()):
+                    self.mark_mine((int(pos[0]), int(pos[1])))
+            elif not self.subset_pass():
+                pos = self.probability_pass()
+                if pos is not None:
+                    if not self.guessing:
+                        break
+                    self.guess(pos)
+        return board.won
+
+    def reveal(self, pos):
+        board = self.board
+        board.dirty = []
+        board.show(*pos)
+        for pos in board.dirty:
+            if board.state[pos] != VISIBLE:
+                continue
+            if board.value[pos]:
+                self.frontier.add(pos)
+                self.todo.add(pos)
+            for n in self.get_neighbours(pos):
+                if n in self.frontier:
+                    self.todo.add(n)
+        board.dirty = []
+
+    def mark_safe(self, pos):
+        if pos not in self.safe_set:
+            self.safe_set.add(pos)
+            self.safe.append(pos)
+
+    def mark_mine(self, pos):
+        if pos in self.mines:
+            return
+        self.mines.add(pos)
+        self.board.flag(*pos)
+        for n in self.get_neighbours(pos):
+            if n in self.frontier:
+                self.todo.add(n)
+
+    def constraint(self, pos):
+        """Returns the unknown neighbours of the number at pos and how
+        many mines are still missing among them"""
+        state = self.board.state
+        unknown = []
+        need = int(self.board.value[pos])
+        for n in self.get_neighbours(pos):
+            if n in self.mines:
+                need -= 1
+            elif state[n] == HIDDEN and n not in self.safe_set:
+                unknown.append(n)
+        return unknown, need
+
+    def constraints(self):
+        """Returns {pos: (frozenset of unknowns, missing mines)} for the
+        frontier, dropping the numbers with nothing left to find"""
+        found = {}
+        for pos in list(self.frontier):
+            unknown, need = self.constraint(pos)
+            if unknown:
+                found[pos] = (frozenset(unknown), need)
+            else:
+                self.frontier.discard(pos)
+        return found
+
+    def single_pass(self):
+        todo, self.todo = self.todo, set()
+        for pos in todo:
+            unknown, need = self.constraint(pos)
+            if not unknown:
+                self.frontier.discard(pos)
+            elif need == 0:
+                for n in unknown:
+                    self.mark_safe(n)
+            elif need == len(unknown):
+                for n in unknown:
+                    self.mark_mine(n)
+
+    def subset_pass(self):
+        """Returns whether some cell was found to be safe or a mine"""
+        found = self.constraints()
+        progress = False
+        for (x, y), (small, small_need) in found.items():
+            # numbers sharing unknowns are at most two cells apart
+            for dx in range(-2, 3):
+                for dy in range(-2, 3):
+                    other = found.get((x+dx, y+dy))
+                    if other is None or (dx == dy == 0):
+                        continue
+                    big, big_need = other
+                    if len(small) >= len(big) or not small <= big:
+                        continue
+                    rest = big - small
+                    missing = big_need - small_need
+                    if missing == 0:
+                        for n in rest:
+                            self.mark_safe(n)
+                        progress = True
+                    elif missing == len(rest):
+                        for n in rest:
+                            self.mark_mine(n)
+                        progress = True
+        return progress
+
+    def components(self, found):
+        """Splits the constraints into groups that share no unknowns
+        Returns a list of (cells, constraints) pairs"""
+        parent = {}
+        def root(c):
+            while parent[c] != c:
+                parent[c] = parent[parent[c]]
+                c = parent[c]
+            return c
+        for unknown, need in found.values():
+            cells = list(unknown)
+            for c in cells:
+                parent.setdefault(c, c)
+            for c in cells[1:]:
+                parent[root(c)] = root(cells[0])
+        groups = {}
+        for unknown, need in found.values():
+            r = root(next(iter(unknown)))
+            groups.setdefault(r, []).append((unknown, need))
+        result = []
+        for cons in groups.values():
+            cells = set()
+            for unknown, need in cons:
+                cells |= unknown
+            result.append((cells, cons))
+        return result
+
+    def enumerate(self, cells, cons):
+        """Counts the mine placements of one component
+        Returns the cells in order and {k: [ways with k mines, [ways
+        each cell is a mine]]}, or None when it is too big to enumerate"""
+        if len(cells) > MAX_COMPONENT:
+            return None
+        # visit the cells constraint by constraint so that partial
+        # assignments get pruned early
+        order = []
+        seen = set()
+        for unknown, need in sorted(cons, key=lambda c: len(c[0])):
+            for c in sorted(unknown):
+                if c not in seen:
+                    seen.add(c)
+                    order.append(c)
+        index = {c: i for i, c in enumerate(order)}
+        n = len(order)
+        var_cons = [[] for i in range(n)]
+        needs, left = [], []
+        for k, (unknown, need) in enumerate(cons):
+            needs.append(need)
+            left.append(len(unknown))
+            for c in unknown:
+                var_cons[index[c]].append(k)
+
+        results = {}
+        assignment = [0]*n
+        nodes = [0]
+
+        def visit(i, mines):
+            nodes[0] += 1
+            if nodes[0] > MAX_NODES:
+                raise OverflowError
+            if i == n:
+                found = results.setdefault(mines, [0, [0]*n])
+                found[0] += 1
+                per_cell = found[1]
+                for j in range(n):
+                    per_cell[j] += assignment[j]
+                return
+            for value in (0, 1):
+                ok = True
+                for k in var_cons[i]:
+                    needs[k] -= value
+                    left[k] -= 1
+                    if needs[k] < 0 or needs[k] > left[k]:
+                        ok = False
+                if ok:
+                    assignment[i] = value
+                    visit(i+1, mines+value)
+                for k in var_cons[i]:
+                    needs[k] += value
+                    left[k] += 1
+            assignment[i] = 0
+
+        try:
+            visit(0, 0)
+        except OverflowError:
+            return None
+        return order, results
+
+    def probability_pass(self):
+        """Plays the cells that are certainly safe or mines, if any
+        Otherwise returns the cell that is least likely to be a mine"""
+        board = self.board
+        found = self.constraints()
+        frontier_cells = set()
+        for unknown, need in found.values():
+            frontier_cells |= unknown
+        remaining = board.bombs - len(self.mines)
+        interior = [pos for pos in zip(*(board.state == HIDDEN).nonzero())
+                    if pos not in self.mines]
+        interior = [(int(x), int(y)) for x, y in interior
+                    if (x, y) not in frontier_cells]
+
+        comps = []
+        for cells, cons in self.components(found):
+            result = self.enumerate(cells, cons)
+            if result is None:
+                return self.local_guess(found, interior, remaining)
+            comps.append(result)
+
+        # ways to put r mines among the interior cells
+        comb = lambda r: math.comb(len(interior), r) if r >= 0 else 0
+        def convolve(dists):
+            total = {0: 1}
+            for dist in dists:
+                new = {}
+                for a, wa in total.items():
+                    for b, (wb, _) in dist.items():
+                        new[a+b] = new.get(a+b, 0) + wa*wb
+                total = new
+            return total
+
+        dists = [dist for order, dist in comps]
+        everything = convolve(dists)
+        total = sum(w*comb(remaining-t) for t, w in everything.items())
+        best, best_ways = None, None
+        certain = False
+        for k, (order, dist) in enumerate(comps):
+            others = convolve(dists[:k] + dists[k+1:])
+            mine_ways = [0]*len(order)
+            for m, (ways, per_cell) in dist.items():
+                weight = sum(w*comb(remaining-m-t) for t, w in others.items())
+                for j, count in enumerate(per_cell):
+                    mine_ways[j] += count*weight
+            for c, ways in zip(order, mine_ways):
+                if ways == 0:
+                    self.mark_safe(c)
+                    certain = True
+                elif ways == total:
+                    self.mark_mine(c)
+                    certain = True
+                elif best_ways is None or ways < best_ways:
+                    best, best_ways = c, ways
+        if certain:
+            return None
+        if interior:
+            # every interior cell is as likely as any other to be a mine
+            interior_ways = sum(w*comb(remaining-t)*(remaining-t)
+                                for t, w in everything.items()) // len(interior)
+            if best_ways is None or interior_ways < best_ways:
+                best = self.pick_interior(interior)
+        return best
+
+    def local_guess(self, found, interior, remaining):
+        """Guess for when exact enumeration is too expensive: each
+        cell gets the highest chance any of its numbers gives it"""
+        chance = {}
+        for unknown, need in found.values():
+            p = need/len(unknown)
+            for c in unknown:
+                chance[c] = max(chance.get(c, 0), p)
+        best = min(chance, key=chance.get) if chance else None
+        if interior:
+            p = max(0, remaining - sum(chance.values()))/len(interior)
+            if best is None or p < chance[best]:
+                best = self.pick_interior(interior)
+        return best
+
+    def pick_interior(self, interior):
+        # corners and edges open up more often
+        w, h = self.board.width - 1, self.board.height - 1
+        corners = [c for c in interior if c[0] in (0, w) and c[1] in (0, h)]
+        return self.rng.choice(corners or interior)
+
+    def guess(self, pos):
+        self.guesses += 1
+        self.reveal(pos)
+
+
+def play(size, bombs, seed=None):
+    """Generates and solves a board headlessly
+    Returns whether it was won and how many guesses it took"""
+    random.seed(seed)
+    board = Board(size, size, None, bombs)
+    solver = Solver(board, random.Random(seed))
+    won = solver.solve()
+    return won, solver.guesses
+
+def benchmark(sizes, densities, games, seed=0):
+    """Prints the win rate and solve times for each size and density"""
+    print("{:>6} {:>8} {:>6} {:>8} {:>9} {:>9} {:>9}".format(
+        "size", "density", "games", "win %", "mean ms", "median ms", "max ms"))
+    for size in sizes:
+        for density in densities:
+            bombs = int(size*size*density)
+            wins, times = 0, []
+            for game in range(games):
+                t = time.perf_counter()
+                won, guesses = play(size, bombs, seed+game)
+                times.append(time.perf_counter() - t)
+                wins += won
+            times.sort()
+            print("{:>6} {:>8.3f} {:>6} {:>8.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                size, density, games, 100*wins/games,
+                1000*sum(times)/games, 1000*times[games//2], 1000*times[-1]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[9, 16, 30, 100])
+    parser.add_argument("--densities", type=float, nargs="+",
+                        default=[0.123, 0.156, 0.206])
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark(args.sizes, args.densities, args.games, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Plays pigeon.py without a display, for tuning the game
+
+An Autopilot flies the pigeon: it follows the poop it could drop
+along its fall, tick by tick as Poop.update moves it, and poops when
+the poop would land on someone not pooped on yet. Games are seeded, so
+the same arguments play the same games, and every level is played in
+a pool of processes:
+    python headless.py --games 20 --levels 1 10
+prints, for each level, how the hit rates are spread over the games.
+--poop-wait and --spawn replace the level's rest between poopings and
+seconds between people, to try other values.
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import math
+import bisect
+import random
+import argparse
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+import pygame
+import pigeon
+from pigeon import Game, Pigeon, TICK, GAME_DURATION
+
+
+class Autopilot(object):
+    """Decides when the pigeon of a Game poops"""
+    def __init__(self, game):
+        self.game = game
+        self.poop_size = pigeon.load_image("poop.png", transparent=True)[1].size
+        # people a poop on its way will hit
+        self.targets = set()
+        self.paths = {}
+
+    def path(self):
+        """Returns where a poop dropped now will be at every TICK until
+        it hits the ground, as lists of x, of y (growing) and of times
+        It only depends on where the pigeon is, so it is kept."""
+        center = self.game.pigeon.rect.center
+        if center not in self.paths:
+            x0, y0 = center
+            poop = pygame.Rect((0, 0), self.poop_size)
+            xs, ys, ts = [], [], []
+            tick = 1
+            while True:
+                t = tick*TICK
+                poop.center = (round(x0 - pigeon.POOP_DRIFT*t),
+                               round(y0 + pigeon.POOP_SPEED*t +
+                                     pigeon.GRAVITY*t*t/2))
+                if poop.bottom >= pigeon.GROUND_LEVEL:
+                    break
+                xs.append(poop.centerx)
+                ys.append(poop.centery)
+                ts.append(t)
+                tick += 1
+            self.paths[center] = xs, ys, ts
+        return self.paths[center]
+
+    def target(self):
+        """Returns the person a poop dropped now would hit, or None"""
+        self.targets = set(p for p in self.targets if p.alive())
+        xs, ys, ts = self.path()
+        scroller = self.game.scroller
+        first, target = len(ts), None
+        for person in self.game.manager.people:
+            if person.pooped or person in self.targets:
+                continue
+            for rect in person.hit_rects():
+                # only while the poop is as high as the rect
+                for tick in range(bisect.bisect_left(ys, rect.top),
+                                  min(bisect.bisect_left(ys, rect.bottom),
+                                      first)):
+                    # as Background_Scroller.update adds it up
+                    scrolled = math.floor(scroller.pending[0] +
+                                    scroller.scroll_speed[0]*ts[tick] + 1e-9)
+                    if rect.collidepoint(xs[tick] + scrolled, ys[tick]):
+                        first, target = tick, person
+                        break
+        return target
+
+    def step(self):
+        """Poops if that hits someone, then advances the game a TICK"""
+        if self.game.can_poop():
+            person = self.target()
+            if person is not None:
+                self.game.poop()
+                self.targets.add(person)
+        self.game.step(TICK)
+
+
+screen = None
+
+def play(lvl, seed, poop_wait=None, spawn_interval=None,
+            duration=GAME_DURATION):
+    """Plays a game with the Autopilot
+    Returns the hits, the people that appeared and the poops pooped"""
+    global screen
+    if screen is None:
+        # images are loaded from bin/, next to this file
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        screen = pygame.display.set_mode(pigeon.SCREEN_SIZE)
+        pigeon.preload_images()
+    random.seed(seed)
+    game = Game(screen, lvl, poop_wait, spawn_interval, duration, bake=False)
+    pilot = Autopilot(game)
+    while not game.is_over():
+        pilot.step()
+    return Pigeon.hits, Pigeon.people_appeared, Pigeon.times_pooped
+
+def play_level(lvl, games, seed, poop_wait=None, spawn_interval=None,
+                duration=GAME_DURATION):
+    """Plays games games at level lvl
+    Returns a (hits, people, poops) tuple for each"""
+    return [play(lvl, "{}-{}-{}".format(seed, lvl, n), poop_wait,
+                    spawn_interval, duration) for n in range(games)]
+
+def spread(rates):
+    """Min, quartiles, max and mean of some rates, in %"""
+    rates = sorted(100*r for r in rates)
+    if len(rates) > 1:
+        q1, median, q3 = statistics.quantiles(rates, n=4,
+                                                method="inclusive")
+    else:
+        q1 = median = q3 = rates[0]
+    return rates[0], q1, median, q3, rates[-1], statistics.mean(rates)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--levels", type=int, nargs=2, default=[1, 10],
+                        metavar=("FIRST", "LAST"))
+    parser.add_argument("--games", type=int, default=20,
+                        help="games per level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=GAME_DURATION/1000,
+                        help="seconds per game")
+    parser.add_argument("--poop-wait", type=float, default=None,
+                        help="seconds of rest between poopings")
+    parser.add_argument("--spawn", type=float, nargs=2, default=None,
+                        metavar=("MIN", "MAX"),
+                        help="least and most seconds between two people")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    levels = range(args.levels[0], args.levels[1] + 1)
+    with ProcessPoolExecutor(args.processes) as pool:
+        results = list(pool.map(play_level, levels,
+                                [args.games]*len(levels),
+                                [args.seed]*len(levels),
+                                [args.poop_wait]*len(levels),
+                                [args.spawn]*len(levels),
+                                [args.duration*1000]*len(levels)))
+
+    columns = ("min", "q1", "median", "q3", "max", "mean")
+    print("hit rates over {} games of {:g} s, in %".format(args.games,
+                                                         args.duration))
+    print("{:>5}  {:>15}".format("level", "") +
+          "".join("{:>7}".format(c) for c in columns))
+    for lvl, games in zip(levels, results):
+        people = [hits/max(appeared, 1) for hits, appeared, _ in games]
+        poops = [hits/max(pooped, 1) for hits, _, pooped in games]
+        for name, rates in [("of the people", people),
+                            ("of the poops", poops)]:
+            print("{:>5}  {:>15}".format(lvl if name == "of the people"
+                                         else "", name) +
+                  "".join("{:7.1f}".format(r) for r in spread(rates)))
+
+if __name__ == "__main__":
+    main()
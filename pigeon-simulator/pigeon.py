@@ -9,21 +9,42 @@ from pygame.locals import *
 
 pygame.init()
 
+# converted surfaces, by (name, transparent); they are shared, so
+# nobody draws on them, and every caller gets its own Rect
+image_cache = {}
+
 def load_image(name, transparent=False):
     """Function that handles image loading
     Returns the image and its Rect"""
-    path_to = os.path.join("bin", name)
-    try:
-        img = pygame.image.load(path_to)
-    except pygame.error:
-        raise SystemExit("Could not load image " + name)
-    if not transparent:
-        img = img.convert()
-    img = img.convert_alpha()
+    img = image_cache.get((name, transparent))
+    if img is None:
+        path_to = os.path.join("bin", name)
+        try:
+            img = pygame.image.load(path_to)
+        except pygame.error:
+            raise SystemExit("Could not load image " + name)
+        if not transparent:
+            img = img.convert()
+        img = img.convert_alpha()
+        image_cache[(name, transparent)] = img
     img_rect = img.get_rect()
 
     return img, img_rect
 
+def preload_images():
+    """Loads every image the game uses, so that none is decoded
+    in the middle of the game"""
+    load_image("city.png")
+    for name in ["pigeon.png", "poop.png", "ground_poop.png",
+                 "person_poop.png"]:
+        load_image(name, transparent=True)
+    for colour in range(1, 9):
+        load_image("person" + str(colour) + ".png", transparent=True)
+        load_image("person" + str(colour) + "p.png", transparent=True)
+
+
+# people are bucketed by x in strips this many pixels wide
+BUCKET_WIDTH = 64
 
 class Background_Manager(pygame.sprite.Group):
     """Manager to control all the sprites in the scenery
@@ -35,38 +56,117 @@ class Background_Manager(pygame.sprite.Group):
     also decide whether to create a new Person or not
     draw() > override so that it calls every draw_it()
     add() > override so that we can separately keep track of
-    falling poops AND people"""
-    def __init__(self, bg, *sprites):
-        pygame.sprite.Group.__init__(self, sprites)
+    pigeons, people, falling poops AND landed poops, each in its
+    own group; people are also bucketed by x so that a poop only
+    looks at the people right below it (see people_at)
+    With bake=True landed poops don't stay sprites: they are stamped
+    on a Decal_Strip, under everything for the ones on the ground and
+    over everything for the ones on people"""
+    def __init__(self, bg, *sprites, bake=False):
+        self.pigeons = pygame.sprite.Group()
+        self.people = pygame.sprite.Group()
+        self.falling = pygame.sprite.Group()
+        self.landed = pygame.sprite.Group()
+        self.buckets = {}
+        pygame.sprite.Group.__init__(self)
+        self.add(*sprites)
         self.background = bg
+        self.bake = bake
+        if bake:
+            # ground poops land around GROUND_LEVEL, and the poops on
+            # people sit below the tops of their heads (see Person)
+            bottom = bg.screen.get_height()
+            self.ground_decals = Decal_Strip(bg.screen, GROUND_LEVEL - 16,
+                                             min(GROUND_LEVEL + 16, bottom))
+            self.top_decals = Decal_Strip(bg.screen, 60, bottom)
+
+    def add(self, *sprites):
+        pygame.sprite.Group.add(self, *sprites)
+        for sprite in sprites:
+            sprite.manager = self
+            if isinstance(sprite, Pigeon):
+                self.pigeons.add(sprite)
+            elif isinstance(sprite, Person):
+                self.people.add(sprite)
+                self.bucket(sprite)
+            elif isinstance(sprite, Poop):
+                if sprite.state == "falling":
+                    self.falling.add(sprite)
+                else:
+                    self.landed.add(sprite)
+
+    def bucket(self, person):
+        first = int(person.rect.left)//BUCKET_WIDTH
+        last = int(person.rect.right - 1)//BUCKET_WIDTH
+        for b in range(first, last + 1):
+            self.buckets.setdefault(b, []).append(person)
+
+    def people_at(self, x):
+        """Returns the people that may span the column x"""
+        return self.buckets.get(int(x)//BUCKET_WIDTH, [])
+
+    def poop_fell(self, poop, on_person=False):
+        if not self.bake:
+            self.falling.remove(poop)
+            self.landed.add(poop)
+            return
+        strip = self.top_decals if on_person else self.ground_decals
+        strip.stamp(poop.image, poop.rect)
+        poop.kill()
 
     def draw(self):
         self.background.draw_it()
+        if self.bake:
+            self.ground_decals.draw_it()
         for sprite in self.sprites():
             sprite.draw_it()
-
-    def update(self):
-        self.background.update()
+        if self.bake:
+            self.top_decals.draw_it()
+
+    def update(self, dt):
+        """Advances everything dt seconds; what stands on the ground
+        moves with the background, by the same whole pixels"""
+        self.background.update(dt)
+        dx = self.background.get_scroll()[0]
+        if self.bake:
+            self.ground_decals.scroll(dx)
+            self.top_decals.scroll(dx)
         for sprite in self.sprites():
-            sprite.update()
+            sprite.update(dt, dx)
             if sprite.rect.right <= 0:
-                self.remove(sprite)
+                sprite.kill()
+        # people move every frame, so the buckets are rebuilt
+        self.buckets = {}
+        for person in self.people:
+            self.bucket(person)
 
 
 class Background_Scroller(pygame.sprite.Sprite):
     """Class to update the background.
     Takes a name of the image to be used and the scrolling speed
-    in pixels per second."""
+    in pixels per second.
+    The fractions of a pixel add up in self.pending until they make
+    whole pixels, so any speed works at any update rate."""
     def __init__(self, name, speed, screen):
         self.image, self.rect = load_image(name)
         self.scroll_speed = speed
         self.screen = screen
+        self.pending = [0.0, 0.0]
+        self.scroll = (0, 0)
         
         self.offset = int(self.rect.width/2)
         self.rect = pygame.Rect(0, 0, self.offset, self.rect.height)
 
-    def update(self):
-        self.rect.move_ip(self.get_scroll())
+    def update(self, dt):
+        scroll = []
+        for axis in range(2):
+            self.pending[axis] += self.scroll_speed[axis]*dt
+            # the epsilon keeps 0.9999... from costing a whole pixel
+            whole = math.floor(self.pending[axis] + 1e-9)
+            self.pending[axis] -= whole
+            scroll.append(whole)
+        self.scroll = tuple(scroll)
+        self.rect.move_ip(self.scroll)
 
         if self.rect.left >= self.offset:
             self.rect.left -= self.offset
@@ -75,7 +175,56 @@ class Background_Scroller(pygame.sprite.Sprite):
         self.screen.blit(self.image, (0, 0), self.rect)
 
     def get_scroll(self):
-        return (self.scroll_speed[0]//FPS, self.scroll_speed[1]//FPS)
+        """Returns the whole pixels scrolled by the last update"""
+        return self.scroll
+
+
+class Decal_Strip(object):
+    """A transparent layer that scrolls along with the background
+    Images stamped on it stay where they were put in the scenery, so
+    things that no longer move by themselves can stop being sprites.
+    The strip only covers the screen rows from top to bottom (what is
+    stamped outside them is cut off) and is a ring a bit wider than
+    the screen: scenery column x lives in column x % width, and the
+    columns that scroll off the left are cleared to be reused."""
+    def __init__(self, screen, top, bottom, margin=64):
+        self.screen = screen
+        self.w = screen.get_width()
+        self.top, self.h = top, bottom - top
+        self.width = self.w + margin
+        self.image = pygame.Surface((self.width, self.h), SRCALPHA)
+        self.scrolled = 0
+        # once scrolled this far, everything stamped is off screen
+        self.empty_after = 0
+
+    def stamp(self, image, rect):
+        # whatever is off screen now would never be seen
+        visible = rect.clip((0, self.top, self.w, self.h))
+        if not visible.width:
+            return
+        area = visible.move(-rect.left, -rect.top)
+        x = (visible.left + self.scrolled) % self.width
+        y = visible.top - self.top
+        self.image.blit(image, (x, y), area)
+        if x + visible.width > self.width:
+            self.image.blit(image, (x - self.width, y), area)
+        self.empty_after = max(self.empty_after, self.scrolled + visible.right)
+
+    def scroll(self, dx):
+        x = self.scrolled % self.width
+        self.image.fill((0, 0, 0, 0), (x, 0, dx, self.h))
+        if x + dx > self.width:
+            self.image.fill((0, 0, 0, 0), (0, 0, x + dx - self.width, self.h))
+        self.scrolled += dx
+
+    def draw_it(self):
+        if self.scrolled >= self.empty_after:
+            return
+        x = self.scrolled % self.width
+        self.screen.blit(self.image, (0, self.top), (x, 0, self.w, self.h))
+        if x + self.w > self.width:
+            self.screen.blit(self.image, (self.width - x, self.top),
+                             (0, 0, x + self.w - self.width, self.h))
 
 
 class Pigeon(pygame.sprite.Sprite):
@@ -92,44 +241,51 @@ class Pigeon(pygame.sprite.Sprite):
         self.float_between = (13, 26)
         self.rect.left = 160
         self.rect.top = random.randint(*self.float_between)
+        self.y = self.rect.top
 
         self.screen = screen
 
-    def update(self):
+    def update(self, dt, scroll=0):
         if self.rect.top >= self.float_between[1]:
             self.state = "up"
         elif self.rect.top <= self.float_between[0]:
             self.state = "down"
 
-        f = random.randint(1,2)
+        f = random.randint(1,2)*FLAP_SPEED*dt
         f = f if self.state == "down" else -f
-        self.rect.move_ip((0, f))
+        self.y += f
+        self.rect.top = round(self.y)
 
     def draw_it(self):
         self.screen.blit(self.image, self.rect)
 
     def poop(self):
-        bg_man = self.groups()[0]
-        bg_man.add(Poop(self.rect.center, self.screen))
+        self.manager.add(Poop(self.rect.center, self.screen))
 
 
 class Poop(pygame.sprite.Sprite):
-    """Implements the poops pooped by the Pigeon"""
+    """Implements the poops pooped by the Pigeon
+    A falling poop keeps its exact position in (x, y) and its
+    falling speed, in pixels per second, in fall"""
     def __init__(self, pooped_from, screen):
         pygame.sprite.Sprite.__init__(self)
         self.screen = screen
         self.image, self.rect = load_image("poop.png", transparent=True)
-        self.fall = 1
+        self.fall = POOP_SPEED
         self.state = "falling"
         
         self.rect.center = pooped_from
+        self.x, self.y = pooped_from
 
-    def update(self):
+    def update(self, dt, scroll=0):
         if self.state == "falling":
-            self.rect.move_ip((-1, self.fall))
-            self.fall += 0.5
+            # exact for a constant gravity, whatever dt is
+            self.x -= POOP_DRIFT*dt
+            self.y += self.fall*dt + GRAVITY*dt*dt/2
+            self.fall += GRAVITY*dt
+            self.rect.center = (round(self.x), round(self.y))
         elif self.state == "fell":
-            self.rect.move_ip((-SCROLL_SPEED/FPS, 0))
+            self.rect.move_ip((-scroll, 0))
 
         # stop it from testing for collisions if it has
         # already fell!
@@ -144,13 +300,13 @@ class Poop(pygame.sprite.Sprite):
             new_rect.left = self.rect.left
             new_rect.top = self.rect.top
             self.rect = new_rect
+            self.manager.poop_fell(self)
         # test for person collision
         else:
             # test to see if poop collided with any Person object
-            # the callback already tests the type of collision
-            # to prevent poop <> poop collision
-            l = pygame.sprite.spritecollide(self, bg_manager, False,
-                                            Poop.is_colliding)
+            # below it; the buckets only hold people
+            l = [person for person in self.manager.people_at(self.rect.centerx)
+                    if Poop.is_colliding(self, person)]
             if l:
                 self.state = "fell"
                 self.image, r = load_image("person_poop.png",
@@ -161,6 +317,7 @@ class Poop(pygame.sprite.Sprite):
                 Pigeon.hits += 1
                 for person in l:
                     person.swap()
+                self.manager.poop_fell(self, on_person=True)
 
     def draw_it(self):
         self.screen.blit(self.image, self.rect)
@@ -169,22 +326,8 @@ class Poop(pygame.sprite.Sprite):
         if not isinstance(sprite, Person):
             return False
 
-        # get head rect. collides?
-        top = sprite.rect.top
-        left = sprite.rect.left+4
-        width = height = 13
-        head_rect = pygame.Rect(left, top, width, height)
-        
-        if head_rect.collidepoint(poop.rect.center):
-            return True
-
-        # get arms rect
-        width, height = 21, 4
-        top = sprite.rect.top + 13
-        left = sprite.rect.left
-        arms_rect = pygame.Rect(left, top, width, height)
-
-        return arms_rect.collidepoint(poop.rect.center)
+        return any(rect.collidepoint(poop.rect.center)
+                    for rect in sprite.hit_rects())
 
 
 class Person(pygame.sprite.Sprite):
@@ -200,17 +343,26 @@ class Person(pygame.sprite.Sprite):
 
         self.walk_speed = speed
         self.screen = screen
+        self.pooped = False
 
 
-    def update(self):
-        self.rect.move_ip((-SCROLL_SPEED/FPS, 0))
+    def update(self, dt, scroll=0):
+        self.rect.move_ip((-scroll, 0))
 
     def draw_it(self):
         self.screen.blit(self.image, self.rect)
 
+    def hit_rects(self):
+        """Returns the Rects a poop can hit: the head and the arms"""
+        top, left = self.rect.top, self.rect.left
+        head_rect = pygame.Rect(left+4, top, 13, 13)
+        arms_rect = pygame.Rect(left, top+13, 21, 4)
+        return head_rect, arms_rect
+
     def swap(self):
         self.image, r = load_image("person"+str(self.n)+"p.png",
                                     transparent=True)
+        self.pooped = True
 
 
 class Person_Factory(object):
@@ -228,10 +380,90 @@ class Person_Factory(object):
         # for now, Person objects don't walk
         return Person(name, colour, 0, self.screen)
 
-screen = pygame.display.set_mode((1000, 140))
-pygame.display.set_caption("Pigeon (pooping) Simulator")
 
-if pygame.font:
+SCREEN_SIZE = (1000, 140)
+FPS = 144  # maximum number of frames per second
+TICK = 1/120  # seconds simulated per update, whatever the frame rate
+MAX_LAG = 0.25  # most seconds caught up on after a stall
+GROUND_LEVEL = 118  # the level at which the poop collides with the floor
+GAME_DURATION = 60000  # game duration in milisseconds (60s for now)
+# in pixels per second (squared, for GRAVITY); the game was first
+# tuned at 30 frames per second, hence the 30s
+FLAP_SPEED = 30  # times 1 or 2, at random
+POOP_SPEED = 30
+POOP_DRIFT = 30
+GRAVITY = 0.5*30*30
+BAKE_POOPS = True  # landed poops become part of the scenery
+
+
+class Game(object):
+    """One flight of the pigeon at a difficulty level from 1 to 10
+    Holds the scenery and the countdowns, without drawing anything:
+    step(dt) advances the game dt seconds and poop() poops, if the
+    pigeon has rested long enough.
+    poop_wait (seconds of rest between poopings) and spawn_interval
+    (the least and most seconds between two people) default to what
+    the level asks for, but can be given to try other values."""
+    def __init__(self, screen, lvl, poop_wait=None, spawn_interval=None,
+                    duration=GAME_DURATION, bake=BAKE_POOPS):
+        Pigeon.hits = Pigeon.people_appeared = Pigeon.times_pooped = 0
+        self.lvl = lvl
+        self.scroll_speed = 30*lvl  # pixels the BG scrolls per second
+        if poop_wait is None:
+            poop_wait = int(40/lvl)/30
+        if spawn_interval is None:
+            spawn_interval = (int(80/lvl)/30, int(240/lvl)/30)
+        self.poop_wait = poop_wait
+        self.spawn_interval = spawn_interval
+        self.duration = duration
+
+        self.factory = Person_Factory(screen)
+        self.scroller = Background_Scroller("city.png",
+                                            (self.scroll_speed, 0), screen)
+        self.pigeon = Pigeon(screen)
+        self.manager = Background_Manager(self.scroller, bake=bake)
+        self.manager.add(self.pigeon)
+
+        # countdowns, in seconds
+        self.next_person = (int(100/lvl)+5)/30
+        self.poop_cooldown = self.poop_wait
+        self.time = 0
+
+    def step(self, dt):
+        self.time += dt
+        self.poop_cooldown -= dt
+        self.next_person -= dt
+        if self.next_person <= 0:
+            self.next_person += random.uniform(*self.spawn_interval)
+            self.manager.add(self.factory.create())
+        self.manager.update(dt)
+
+    def can_poop(self):
+        return self.poop_cooldown <= 0
+
+    def poop(self):
+        """Poops, if the pigeon is rested; returns whether it did"""
+        if not self.can_poop():
+            return False
+        self.pigeon.poop()
+        Pigeon.times_pooped += 1
+        self.poop_cooldown = self.poop_wait
+        return True
+
+    def is_over(self):
+        return self.time*1000 >= self.duration
+
+
+def choose_level(screen):
+    """Asks for the difficulty level, from 1 to 10"""
+    if not pygame.font:
+        print("Please type in the difficulty level from 1 to 10")
+        lvl = ""
+        lvls = "1 2 3 4 5 6 7 8 9 10".split()
+        while lvl not in lvls:
+            lvl = input("Level 1-10 >> ")
+        return int(lvl)
+
     lvl = 1
     font1, font2 = pygame.font.Font(None, 18), pygame.font.Font(None, 24)
     text1 = font1.render("Please choose the difficulty level: (1 to 10)", 1, (250, 250, 250))
@@ -250,8 +482,7 @@ if pygame.font:
 
     pygame.display.update([text1pos, text2pos, text3pos])
 
-    choosing = True
-    while choosing:
+    while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 sys.exit(0)
@@ -270,83 +501,27 @@ if pygame.font:
                     screen.blit(text2, text2pos)
                     pygame.display.update(text2pos)
                 elif event.key == K_RETURN:
-                    choosing = False
+                    return lvl
                 elif event.key == K_q:
                     sys.exit(0)
-else:
-    print("Please type in the difficulty level from 1 to 10")
-    lvl = ""
-    lvls = "1 2 3 4 5 6 7 8 9 10".split()
-    while lvl not in lvls:
-        lvl = input("Level 1-10 >> ")
-    lvl = int(lvl)
-    
-FPS = 30  # maximum number of frames per second
-SCROLL_SPEED = 30*lvl # the number of pixels the BG scrolls per second
-GROUND_LEVEL = 118  # the level at which the poop collides with the floor
-POOP_WAIT = int(40/lvl)  # number of rest cycles between poopings
-GAME_DURATION = 60000  # game duration in milisseconds (60s for now)
-
-PersonFact = Person_Factory(screen)
-
-bg_scroller = Background_Scroller("city.png", (SCROLL_SPEED, 0), screen)
-pigeon = Pigeon(screen)
-
-bg_manager = Background_Manager(bg_scroller)
-bg_manager.add(pigeon)
-bg_manager.draw()
-
-pygame.display.update()
-clock = pygame.time.Clock()
-
-next_per_countdown = int(100/lvl)+5
-poop_cooldown = POOP_WAIT
-game_start = pygame.time.get_ticks()
-go = True
-while go:
-    clock.tick(FPS)
-    next_per_countdown -= 1
-
-    if poop_cooldown:
-        poop_cooldown -= 1
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            sys.exit(0)
-        elif event.type == KEYDOWN:
-            if event.key == K_q:
-                go = False
-            elif event.key == K_SPACE:
-                if not poop_cooldown:
-                    pigeon.poop()
-                    Pigeon.times_pooped += 1
-                    poop_cooldown = POOP_WAIT
-
-    if next_per_countdown == 0:
-        next_per_countdown = random.randint(int(80/lvl), int(240/lvl))
-        bg_manager.add(PersonFact.create())
-
-    bg_manager.update()
-    bg_manager.draw()
-    
-    pygame.display.update()
-
-    if pygame.time.get_ticks() - game_start >= GAME_DURATION:
-        go = False
 
-s = """\
+def show_results(screen, game):
+    s = """\
 You, an amazing pigeon, have flown for {GD} seconds.
 For that period of time, you had the chance to ruin {pc} person's days.
 You managed to hit a total of {hc}, from a total of {pooped} poops.
 That means {pper}% of the poops landed and
 {hper}% of the people got their days ruined!.""".format(
-    GD = GAME_DURATION/1000,
-    pc = Pigeon.people_appeared,
-    hc = Pigeon.hits,
-    pooped = Pigeon.times_pooped,
-    pper = int(Pigeon.hits/Pigeon.times_pooped*100),
-    hper = int(Pigeon.hits/Pigeon.people_appeared*100))
-if pygame.font:
+        GD = game.duration/1000,
+        pc = Pigeon.people_appeared,
+        hc = Pigeon.hits,
+        pooped = Pigeon.times_pooped,
+        pper = int(Pigeon.hits/Pigeon.times_pooped*100),
+        hper = int(Pigeon.hits/Pigeon.people_appeared*100))
+    if not pygame.font:
+        print(s)
+        return
+
     screen.fill((0, 0, 0))
 
     font = pygame.font.Font(None, 18)
@@ -368,5 +543,46 @@ if pygame.font:
             elif ev.type == KEYDOWN and ev.key == K_q:
                 sys.exit(0)
 
-else:
-    print(s)
+def main():
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    pygame.display.set_caption("Pigeon (pooping) Simulator")
+
+    lvl = choose_level(screen)
+    preload_images()
+    game = Game(screen, lvl)
+    game.manager.draw()
+
+    pygame.display.update()
+    clock = pygame.time.Clock()
+
+    # the game advances TICK seconds at a time, as many times as
+    # the real time elapsed allows
+    lag = 0
+    go = True
+    while go:
+        lag += min(clock.tick(FPS)/1000, MAX_LAG)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                sys.exit(0)
+            elif event.type == KEYDOWN:
+                if event.key == K_q:
+                    go = False
+                elif event.key == K_SPACE:
+                    game.poop()
+
+        while lag >= TICK:
+            lag -= TICK
+            game.step(TICK)
+
+        game.manager.draw()
+        
+        pygame.display.update()
+
+        if game.is_over():
+            go = False
+
+    show_results(screen, game)
+
+if __name__ == "__main__":
+    main()